@@ -0,0 +1,152 @@
+import io, json, struct, sys
+from pathlib import Path, PurePath
+
+import pygame
+
+# Bundle layout (little endian):
+#   header     magic, version, manifest length
+#   manifest   UTF-8 JSON: atlas sizes and offsets, sprite rects, offsets of the other files
+#   data       every atlas as a PNG, then the sound and font files as they are on disk
+MAGIC = b'PKAB'
+VERSION = 2
+HEADER = struct.Struct('<4sHI')
+
+# Sprites closer than this would bleed into each other when scaled
+PADDING = 1
+# Sprites with a side longer than this are not packed together with others
+LARGE = 256
+
+
+def pack_shelves(sizes, width):
+    # Shelf packing, tallest first: returns the (x, y) of every size and the atlas height
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    positions = [None] * len(sizes)
+    x = y = shelf_height = 0
+    for i in order:
+        w, h = sizes[i]
+        if x + w > width:
+            x, y, shelf_height = 0, y + shelf_height + PADDING, 0
+        positions[i] = (x, y)
+        x += w + PADDING
+        shelf_height = max(shelf_height, h)
+    return positions, y + shelf_height
+
+
+def is_opaque(image):
+    # Same test as AssetCache, opaque sprites go into an atlas without per-pixel alpha
+    return pygame.mask.from_surface(image, 254).count() == image.get_width() * image.get_height()
+
+
+def build_bundle(assets_dir='assets', destination='assets.pkbundle'):
+    assets_dir = Path(assets_dir)
+    sprites = {PurePath(path).as_posix(): pygame.image.load(str(path))
+               for path in sorted(assets_dir.glob('sprites/**/*.png'))}
+    files = sorted(list(assets_dir.glob('sounds/*.wav')) + list(assets_dir.glob('fonts/*.ttf')))
+
+    manifest = {'atlases': [], 'sprites': {}, 'files': {}}
+    blobs, offset = [], 0
+    # Sprites this large get an atlas of their own, next to them the small ones would leave most of it empty.
+    # The small sprites go into one atlas for opaque sprites and one with alpha, so opaque sprites keep
+    # blitting without blending
+    groups = [[name] for name, image in sprites.items() if max(image.get_size()) > LARGE]
+    for opaque in (True, False):
+        groups.append([name for name, image in sprites.items()
+                       if max(image.get_size()) <= LARGE and is_opaque(image) == opaque])
+    for names in groups:
+        if not names:
+            continue
+        opaque = all(is_opaque(sprites[name]) for name in names)
+        sizes = [sprites[name].get_size() for name in names]
+        # About square, every decoded atlas pixel costs load time
+        width = max(max(w for w, h in sizes), int(sum(w * h for w, h in sizes) ** 0.5))
+        positions, height = pack_shelves(sizes, width)
+        width = max(x + w for (x, y), (w, h) in zip(positions, sizes))
+        atlas = pygame.Surface((width, height), pygame.SRCALPHA)
+        for name, (x, y), (w, h) in zip(names, positions, sizes):
+            atlas.blit(sprites[name], (x, y))
+            manifest['sprites'][name] = [len(manifest['atlases']), x, y, w, h]
+        # PNG keeps the bundle about as small as the loose files, the empty corners of an atlas cost next to nothing
+        png = io.BytesIO()
+        pygame.image.save(atlas, png, 'atlas.png')
+        png = png.getvalue()
+        manifest['atlases'].append({'size': [width, height], 'opaque': opaque, 'offset': offset, 'length': len(png)})
+        blobs.append(png)
+        offset += len(png)
+
+    for path in files:
+        data = path.read_bytes()
+        manifest['files'][PurePath(path).as_posix()] = [offset, len(data)]
+        blobs.append(data)
+        offset += len(data)
+
+    manifest_data = json.dumps(manifest).encode('utf-8')
+    with open(destination, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(manifest_data)))
+        file.write(manifest_data)
+        file.write(b''.join(blobs))
+    return Path(destination)
+
+
+class AssetBundle():
+    def __init__(self, path):
+        '''Sprites from the atlases as subsurfaces, sounds and fonts from memory, all read with one call'''
+        with open(path, 'rb') as file:
+            self.data = memoryview(file.read())
+        magic, version, manifest_length = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} asset bundle')
+        manifest = json.loads(bytes(self.data[HEADER.size:HEADER.size + manifest_length]))
+        data_start = HEADER.size + manifest_length
+
+        self.atlases = []
+        for atlas in manifest['atlases']:
+            start = data_start + atlas['offset']
+            image = pygame.image.load(io.BytesIO(self.data[start:start + atlas['length']]), 'atlas.png')
+            # Convert the whole atlas once, every sprite in it shares the converted pixels
+            if pygame.display.get_surface() is not None:
+                image = image.convert() if atlas['opaque'] else image.convert_alpha()
+            self.atlases.append(image)
+        self.sprites = manifest['sprites']
+        self.files = {name: (data_start + offset, length) for name, (offset, length) in manifest['files'].items()}
+
+    def key(self, path):
+        # Bundle names use forward slashes whatever the platform
+        return PurePath(path).as_posix()
+
+    def has_sprite(self, path):
+        return self.key(path) in self.sprites
+
+    def has_file(self, path):
+        return self.key(path) in self.files
+
+    def sprite(self, path):
+        atlas, x, y, w, h = self.sprites[self.key(path)]
+        return self.atlases[atlas].subsurface((x, y, w, h))
+
+    def file(self, path):
+        # A file-like object over the bundled bytes, for pygame.mixer.Sound and pygame.font.Font
+        start, length = self.files[self.key(path)]
+        return io.BytesIO(self.data[start:start + length])
+
+
+def load_bundle(path='assets.pkbundle', assets_dir='assets'):
+    # None when there is no bundle, the game then loads the loose files. Like the stage packs, a bundle older
+    # than any of the assets is built again, so edited files don't get shadowed by the old ones
+    path = Path(path)
+    if not path.exists():
+        return None
+    built = path.stat().st_mtime
+    if any(source.stat().st_mtime > built for source in Path(assets_dir).rglob('*') if source.is_file()):
+        build_bundle(assets_dir, path)
+    try:
+        return AssetBundle(path)
+    except ValueError:
+        # Built by an older version of the game
+        build_bundle(assets_dir, path)
+        return AssetBundle(path)
+
+
+if __name__ == '__main__':
+    # Usage: python -m engine.asset_bundle [assets dir] [output .pkbundle]
+    bundle = build_bundle(*sys.argv[1:3])
+    print(f'{bundle}: {bundle.stat().st_size/1024:.0f} KiB')
@@ -0,0 +1,92 @@
+import threading
+
+import pygame
+
+
+class AssetCache():
+    def __init__(self, bundle=None):
+        # Every resource is keyed by its path, so each file is decoded only once
+        self.images = {}
+        self.sounds = {}
+        self.fonts = {}
+        # Packed atlas and files, anything missing from it is loaded from the loose files
+        self.bundle = bundle
+        # Resources are also loaded by the warm-up thread while the menu is up
+        self.lock = threading.RLock()
+        # Statistics
+        self.loads = 0
+        self.hits = 0
+        self.bytes_loaded = 0
+        self.bytes_saved = 0
+
+    def image(self, path):
+        with self.lock:
+            key = str(path)
+            if key in self.images:
+                return self.hit(self.images[key])
+
+            if self.bundle and self.bundle.has_sprite(key):
+                # Already converted together with its atlas
+                image = self.bundle.sprite(key)
+                self.images[key] = (image, image.get_width() * image.get_height() * image.get_bytesize())
+                return self.miss(self.images[key])
+
+            image = pygame.image.load(key)
+            # Convert to the display pixel format for faster blits (only possible once a display is set)
+            if pygame.display.get_surface() is not None:
+                if self.is_opaque(image):
+                    image = image.convert()
+                else:
+                    image = image.convert_alpha()
+            self.images[key] = (image, image.get_pitch() * image.get_height())
+            return self.miss(self.images[key])
+
+    def sound(self, path):
+        with self.lock:
+            key = str(path)
+            if key in self.sounds:
+                return self.hit(self.sounds[key])
+
+            sound = pygame.mixer.Sound(self.source(key))
+            self.sounds[key] = (sound, sound.get_length() * self.bytes_per_second())
+            return self.miss(self.sounds[key])
+
+    def font(self, path, size):
+        with self.lock:
+            key = (str(path), size)
+            if key in self.fonts:
+                return self.hit(self.fonts[key])
+
+            font = pygame.font.Font(self.source(key[0]), size)
+            self.fonts[key] = (font, 0)
+            return self.miss(self.fonts[key])
+
+    def source(self, key):
+        # The bundled bytes when the file is in the bundle, otherwise the path of the loose file
+        if self.bundle and self.bundle.has_file(key):
+            return self.bundle.file(key)
+        return key
+
+    def hit(self, entry):
+        self.hits += 1
+        self.bytes_saved += entry[1]
+        return entry[0]
+
+    def miss(self, entry):
+        self.loads += 1
+        self.bytes_loaded += entry[1]
+        return entry[0]
+
+    def is_opaque(self, image):
+        # A surface without any transparent pixel can use the cheaper convert()
+        if not image.get_flags() & pygame.SRCALPHA:
+            return True
+        return pygame.mask.from_surface(image, 254).count() == image.get_width() * image.get_height()
+
+    def bytes_per_second(self):
+        frequency, size, channels = pygame.mixer.get_init()
+        return frequency * abs(size) // 8 * channels
+
+    def report(self):
+        return (f'Assets: {self.loads} loads ({self.bytes_loaded/1024:.0f} KiB), '
+                f'{self.hits} cache hits ({self.bytes_saved/1024:.0f} KiB saved)')
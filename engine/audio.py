@@ -0,0 +1,82 @@
+import pygame
+
+# Effect priorities, higher ones steal channels from lower ones when all are busy
+WALL_BOUNCE = 0
+BLOCK_HIT = 1
+UI = 2
+STAGE_CLEAR = 3
+LIFE_LOST = 4
+
+
+class AudioManager():
+    def __init__(self, frequency=44100, buffer=256, channels=16, reserved=2, max_per_frame=2):
+        '''Collects play requests during the update and sends them to the mixer once per frame.
+        Has to be created before the mixer is initialized, so it starts with the small buffer.'''
+        # Smaller buffers mean less latency between a hit and its sound
+        pygame.mixer.pre_init(frequency, -16, 2, buffer)
+        self.buffer = buffer
+        self.channels = channels
+        # Channels kept free for the effects of STAGE_CLEAR priority and up
+        self.reserved = reserved
+        # Copies of the same effect started in one frame, the rest would only add up to noise
+        self.max_per_frame = max_per_frame
+        # Requests below this priority are skipped, raised by the quality governor under load
+        self.min_priority = WALL_BOUNCE
+        self.requests = []
+        self.played = 0
+        self.dropped = 0
+        self.skipped = 0
+
+    def start(self):
+        # Starts the mixer with the pre_init settings, it may be unavailable, e.g. without a sound device
+        try:
+            pygame.mixer.init()
+        except pygame.error:
+            return
+        pygame.mixer.set_num_channels(self.channels)
+        pygame.mixer.set_reserved(self.reserved)
+
+    def set_channels(self, channels):
+        self.channels = channels
+        if pygame.mixer.get_init():
+            pygame.mixer.set_num_channels(channels)
+
+    def play(self, sound, priority=BLOCK_HIT):
+        if priority < self.min_priority:
+            self.skipped += 1
+            return
+        self.requests.append((priority, sound))
+
+    def flush(self):
+        # Called once per frame by the game loop, most important effects first
+        if not self.requests:
+            return
+        requests, self.requests = self.requests, []
+        if not pygame.mixer.get_init():
+            return
+        requests.sort(key=lambda request: request[0], reverse=True)
+        started = {}
+        for priority, sound in requests:
+            if started.get(sound, 0) >= self.max_per_frame:
+                self.dropped += 1
+                continue
+            channel = self.find_channel(priority)
+            if channel is None:
+                self.dropped += 1
+                continue
+            channel.play(sound)
+            started[sound] = started.get(sound, 0) + 1
+            self.played += 1
+
+    def find_channel(self, priority):
+        if priority >= STAGE_CLEAR:
+            for i in range(self.reserved):
+                if not pygame.mixer.Channel(i).get_busy():
+                    return pygame.mixer.Channel(i)
+            return pygame.mixer.find_channel(True)
+        # Block hits cut off the oldest sound when every channel is busy, wall bounces are skipped
+        return pygame.mixer.find_channel(priority >= BLOCK_HIT)
+
+    def report(self):
+        total = self.played + self.dropped + self.skipped
+        return f'Sounds: {self.played} played, {self.dropped} dropped, {self.skipped} skipped of {total} requested'
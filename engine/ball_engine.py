@@ -0,0 +1,174 @@
+import numpy as np
+import pygame
+
+from engine.audio import WALL_BOUNCE
+from engine.collision import move_ball
+
+vector = pygame.math.Vector2
+
+
+def round_half_away(values):
+    # Same rounding as assigning floats to a pygame.Rect
+    return (np.sign(values) * np.floor(np.abs(values) + 0.5)).astype(np.int64)
+
+
+class BallView():
+    # Stand-in for a Ball sprite, handed to move_ball and Block.get_hit for the few balls near the paddle or a block
+    def __init__(self, game, level, image, max_speed, min_speed):
+        self.game = game
+        self.level = level
+        self.max_speed = max_speed
+        self.min_speed = min_speed
+        self.rect = image.get_rect()
+        self.position = vector()
+        self.velocity = vector()
+        self.speed = 0
+        self.angle = 0
+
+
+class BallEngine():
+    def __init__(self, game, level, image, capacity=64):
+        '''Struct-of-arrays replacement for the Ball sprites, updated in one vectorized pass per frame'''
+        self.game = game
+        self.level = level
+        self.image = image
+        self.width, self.height = image.get_size()
+        self.max_speed = 1000
+        self.min_speed = 300
+
+        self.count = 0
+        self.position = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.speed = np.zeros(capacity)
+        self.angle = np.zeros(capacity)
+
+        self.view = BallView(game, level, image, self.max_speed, self.min_speed)
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, x, y, angle, speed):
+        if self.count == len(self.speed):
+            self.grow()
+        i = self.count
+        self.position[i] = x, y
+        self.speed[i] = speed
+        self.angle[i] = angle
+        self.velocity[i] = np.sin(angle)*speed, np.cos(angle)*speed
+        self.count += 1
+        return i
+
+    def grow(self):
+        capacity = 2 * len(self.speed)
+        for name in ('position', 'velocity', 'speed', 'angle'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:])
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def clear(self):
+        self.count = 0
+
+    def rects(self):
+        # Integer rect corners of every live ball, matching Ball.rect
+        center = round_half_away(self.position[:self.count])
+        left = center[:, 0] - self.width // 2
+        top = center[:, 1] - self.height // 2
+        return left, top, left + self.width, top + self.height
+
+    def update(self, delta_time):
+        n = self.count
+        if n == 0:
+            return
+        player_rect = self.level.player.rect
+        if self.level.player.is_magnetic:
+            # Balls stick to the paddle until it is released
+            self.position[:n, 0] = player_rect.centerx
+            self.position[:n, 1] = player_rect.top - self.height / 2
+            return
+
+        start = self.position[:n].copy()
+        end = start + self.velocity[:n] * delta_time
+        near = self.near_paddle_or_blocks(start, end, player_rect)
+
+        # Balls in free flight: integrate and bounce off the walls in one vectorized pass
+        free = ~near
+        self.position[:n][free] = end[free]
+        self.wall_collide(free)
+
+        # Balls that may touch the paddle or a block take the same swept path as a Ball sprite
+        view = self.view
+        for i in np.flatnonzero(near):
+            view.position.update(*start[i])
+            view.velocity.update(*self.velocity[i])
+            view.speed = self.speed[i]
+            view.angle = self.angle[i]
+            move_ball(view, delta_time)
+            self.position[i] = view.position
+            self.velocity[i] = view.velocity
+            self.speed[i] = view.speed
+            self.angle[i] = view.angle
+
+        self.crash(n)
+
+    def near_paddle_or_blocks(self, start, end, player_rect):
+        # Broad phase on the box swept by each ball over this step
+        half_width, half_height = self.width / 2, self.height / 2
+        left = np.floor(np.minimum(start[:, 0], end[:, 0]) - half_width).astype(np.int64)
+        right = np.ceil(np.maximum(start[:, 0], end[:, 0]) + half_width).astype(np.int64)
+        top = np.floor(np.minimum(start[:, 1], end[:, 1]) - half_height).astype(np.int64)
+        bottom = np.ceil(np.maximum(start[:, 1], end[:, 1]) + half_height).astype(np.int64)
+
+        near = ((left <= player_rect.right) & (right >= player_rect.left) & (top <= player_rect.bottom)
+                & (bottom >= player_rect.top) & (self.velocity[:self.count, 1] > 0))
+
+        grid = self.level.block_grid
+        occupied = np.frombuffer(grid.occupied, dtype=np.uint8).reshape(grid.rows, grid.cols)
+        for x in (left - 1, right):
+            col = (x - grid.x) // grid.cell_width
+            for y in (top - 1, bottom):
+                row = (y - grid.y) // grid.cell_height
+                inside = (col >= 0) & (col < grid.cols) & (row >= 0) & (row < grid.rows)
+                near[inside] |= occupied[row[inside], col[inside]].astype(bool)
+        return near
+
+    def wall_collide(self, mask):
+        # Mirroring the position about the wall gives the same result as sweeping the ball into it
+        n = self.count
+        position, velocity = self.position[:n], self.velocity[:n]
+        half_width, half_height = self.width / 2, self.height / 2
+        right_wall, left_wall = self.game.GAME_WIDTH-40, 40
+
+        hit_right = mask & (position[:, 0] + half_width >= right_wall) & (velocity[:, 0] > 0)
+        position[hit_right, 0] -= 2 * (position[hit_right, 0] + half_width - right_wall)
+        velocity[hit_right, 0] = -velocity[hit_right, 0]
+        hit_left = mask & (position[:, 0] - half_width <= left_wall) & (velocity[:, 0] < 0)
+        position[hit_left, 0] += 2 * (left_wall - (position[hit_left, 0] - half_width))
+        velocity[hit_left, 0] = -velocity[hit_left, 0]
+        hit_top = mask & (position[:, 1] - half_height <= 0) & (velocity[:, 1] < 0)
+        position[hit_top, 1] += 2 * (half_height - position[hit_top, 1])
+        velocity[hit_top, 1] = -velocity[hit_top, 1]
+        for _ in range(np.count_nonzero(hit_right) + np.count_nonzero(hit_left) + np.count_nonzero(hit_top)):
+            self.game.audio.play(self.level.hit_wall_sound, WALL_BOUNCE)
+
+    def crash(self, moved):
+        # Balls spawned during this update have not moved yet and always survive
+        _, top, _, _ = self.rects()
+        alive = np.ones(self.count, dtype=bool)
+        alive[:moved] = top[:moved] <= self.game.GAME_HEIGHT+20
+        if alive.all():
+            return
+        # Compact the arrays in place, keeping spawn order
+        kept = np.flatnonzero(alive)
+        self.level.balls_lost += self.count - len(kept)
+        for array in (self.position, self.velocity, self.speed, self.angle):
+            array[:len(kept)] = array[kept]
+        self.count = len(kept)
+        if self.count == 0:
+            self.level.lose_live()
+
+    def draw(self, surface):
+        if self.count == 0:
+            return []
+        left, top, _, _ = self.rects()
+        return surface.blits([(self.image, position) for position in zip(left.tolist(), top.tolist())])
@@ -0,0 +1,140 @@
+from math import cos, sin, inf
+from math import pi as PI
+
+import pygame
+
+from engine.audio import WALL_BOUNCE
+
+vector = pygame.math.Vector2
+
+# Most bounces resolved for one ball within a single simulation step
+MAX_BOUNCES = 4
+
+
+def sweep(box, dx, dy, target):
+    '''Swept AABB test of box moving by (dx, dy) against a static target, both (left, top, right, bottom).
+    Returns (time, side) of the first contact within the move, where side is the face of the target
+    that gets hit, or None when the box misses or only moves away from the target.'''
+    left, top, right, bottom = box
+    target_left, target_top, target_right, target_bottom = target
+
+    if dx > 0:
+        x_entry, x_exit = (target_left - right) / dx, (target_right - left) / dx
+    elif dx < 0:
+        x_entry, x_exit = (target_right - left) / dx, (target_left - right) / dx
+    elif right <= target_left or left >= target_right:
+        return None
+    else:
+        x_entry, x_exit = -inf, inf
+
+    if dy > 0:
+        y_entry, y_exit = (target_top - bottom) / dy, (target_bottom - top) / dy
+    elif dy < 0:
+        y_entry, y_exit = (target_bottom - top) / dy, (target_top - bottom) / dy
+    elif bottom <= target_top or top >= target_bottom:
+        return None
+    else:
+        y_entry, y_exit = -inf, inf
+
+    entry, exit = max(x_entry, y_entry), min(x_exit, y_exit)
+    # An entry at -inf means the box was already inside the target and is not moving into any face
+    if entry >= exit or entry > 1 or exit <= 0 or entry == -inf:
+        return None
+
+    # The axis that starts overlapping last decides which face is hit
+    if x_entry > y_entry:
+        if dx == 0:
+            return None
+        side = 'left' if dx > 0 else 'right'
+    else:
+        if dy == 0:
+            return None
+        side = 'top' if dy > 0 else 'bottom'
+    return max(entry, 0), side
+
+
+def ball_box(ball, half_width, half_height):
+    return (ball.position[0] - half_width, ball.position[1] - half_height,
+            ball.position[0] + half_width, ball.position[1] + half_height)
+
+
+def find_hits(ball, box, dx, dy):
+    # Every target (walls, paddle, blocks) the ball touches first on its way, and the time it happens
+    game, level = ball.game, ball.level
+    targets = [('wall', None, (game.GAME_WIDTH-40, -inf, inf, inf)),
+               ('wall', None, (-inf, -inf, 40, inf)),
+               ('wall', None, (-inf, -inf, inf, 0))]
+    if dy > 0:
+        player_rect = level.player.rect
+        targets.append(('player', None, (player_rect.left, player_rect.top, player_rect.right, player_rect.bottom)))
+
+    # Only blocks in the grid cells covered by the whole move can be hit
+    swept_rect = pygame.Rect(int(min(box[0], box[0] + dx)) - 1, int(min(box[1], box[1] + dy)) - 1,
+                             int(abs(dx) + box[2] - box[0]) + 3, int(abs(dy) + box[3] - box[1]) + 3)
+    for block in level.block_grid.query(swept_rect):
+        targets.append(('block', block, (block.rect.left, block.rect.top, block.rect.right, block.rect.bottom)))
+
+    first_time, hits = inf, []
+    for kind, block, target in targets:
+        hit = sweep(box, dx, dy, target)
+        if hit is None:
+            continue
+        time, side = hit
+        if time < first_time - 1e-9:
+            first_time, hits = time, [(kind, block, side)]
+        elif time <= first_time + 1e-9:
+            hits.append((kind, block, side))
+    return first_time, hits
+
+
+def move_ball(ball, delta_time):
+    '''Advance a ball over delta_time, resolving every wall, paddle and block hit on the way in order'''
+    half_width, half_height = ball.rect.width / 2, ball.rect.height / 2
+    remaining = 1.0
+    for _ in range(MAX_BOUNCES):
+        dx, dy = ball.velocity[0] * delta_time * remaining, ball.velocity[1] * delta_time * remaining
+        with ball.game.profiler.scope('collision'):
+            time, hits = find_hits(ball, ball_box(ball, half_width, half_height), dx, dy)
+        if not hits:
+            break
+        ball.position += vector(dx, dy) * time
+        remaining *= 1 - time
+        for kind, block, side in hits:
+            if kind == 'wall':
+                wall_bounce(ball, side)
+            elif kind == 'player':
+                paddle_bounce(ball)
+            else:
+                block.get_hit(ball, side)
+    else:
+        # Out of bounces for this step, stop here and carry on next step
+        return
+    ball.position += vector(dx, dy)
+
+
+def wall_bounce(ball, side):
+    ball.game.audio.play(ball.level.hit_wall_sound, WALL_BOUNCE)
+    if side == 'left':
+        ball.velocity[0] = -abs(ball.velocity[0])
+    elif side == 'right':
+        ball.velocity[0] = abs(ball.velocity[0])
+    else:
+        ball.velocity[1] = abs(ball.velocity[1])
+
+
+def paddle_bounce(ball):
+    ball.game.audio.play(ball.level.bounce_sound, WALL_BOUNCE)
+    ball_x = ball.position[0]
+    player_x = ball.level.player.rect.centerx
+    player_width = ball.level.player.rect[2]
+
+    # Set new ball angle depending on collide position - the closer to player center the more vertical the angle
+    # The 0.8 is there to ensure min bounce angle is 18deg so that the ball don't bounce too horizontally
+    ball.angle = PI + 0.8 * PI * (player_x - ball_x)/player_width
+
+    # Speed up the ball
+    if ball.speed <= ball.max_speed:
+        ball.speed += 10
+
+    # Set new ball velocity
+    ball.velocity = vector(sin(ball.angle)*ball.speed, cos(ball.angle)*ball.speed)
@@ -0,0 +1,41 @@
+class MouseController():
+    def __init__(self, game):
+        self.game = game
+
+    def paddle_input(self, level):
+        # Paddle x position in game coordinates and whether the ball should be released, from this frame's snapshot
+        return self.game.mouse_pos[0], self.game.mouse_pressed
+
+
+class BallTrackingBot():
+    def __init__(self, game, offsets=(-40, -20, 0, 20, 40)):
+        '''Moves the paddle under the ball that will reach it first, for headless runs'''
+        self.game = game
+        # Hit the ball off-center in turn, so it doesn't bounce on the same line forever
+        self.offsets = offsets
+        self.bounces = 0
+        self.was_descending = False
+
+    def paddle_input(self, level):
+        player_rect = level.player.rect
+        target, first_time = player_rect.centerx, None
+        for x, y, velocity_x, velocity_y in level.ball_states():
+            if velocity_y <= 0:
+                continue
+            time = (player_rect.top - y) / velocity_y
+            if time >= 0 and (first_time is None or time < first_time):
+                first_time, target = time, self.landing_x(x + velocity_x * time)
+
+        descending = first_time is not None
+        if self.was_descending and not descending:
+            self.bounces += 1
+        self.was_descending = descending
+        offset = self.offsets[self.bounces % len(self.offsets)]
+        return target + offset, True
+
+    def landing_x(self, x):
+        # Fold the straight line path back between the side walls
+        left, right = 40 + 9, self.game.GAME_WIDTH - 40 - 9
+        width = right - left
+        x = (x - left) % (2 * width)
+        return left + (x if x <= width else 2 * width - x)
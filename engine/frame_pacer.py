@@ -0,0 +1,46 @@
+from collections import deque
+from statistics import mean, pstdev
+from time import perf_counter
+
+import pygame
+
+
+class FramePacer():
+    def __init__(self, fps_cap=144, idle_fps=30, history=240):
+        '''Caps the frame rate and measures frame times with a high resolution monotonic clock'''
+        # 0 means uncapped
+        self.fps_cap = fps_cap
+        # Frame rate used while the active state is idle (menus, pause screens)
+        self.idle_fps = idle_fps
+        self.clock = pygame.time.Clock()
+        self.frame_times = deque(maxlen=history)
+        self.prev_time = perf_counter()
+
+    def tick(self, idle=False):
+        # Sleep until the next frame is due and return the real time since the last one
+        cap = self.idle_fps if idle and self.idle_fps else self.fps_cap
+        if cap:
+            self.clock.tick(cap)
+        now = perf_counter()
+        delta_time = now - self.prev_time
+        self.prev_time = now
+        self.frame_times.append(delta_time)
+        return delta_time
+
+    def reset(self):
+        # Start timing from now, e.g. after a blocking load, so the next delta isn't a huge jump
+        self.prev_time = perf_counter()
+
+    def stats(self):
+        if not self.frame_times:
+            return {'fps': 0, 'mean_ms': 0, 'jitter_ms': 0, 'max_ms': 0}
+        frame_mean = mean(self.frame_times)
+        return {'fps': 1 / frame_mean if frame_mean else 0,
+                'mean_ms': frame_mean * 1000,
+                'jitter_ms': pstdev(self.frame_times) * 1000,
+                'max_ms': max(self.frame_times) * 1000}
+
+    def report(self):
+        stats = self.stats()
+        return (f"Frames: {stats['fps']:.0f} fps, {stats['mean_ms']:.2f} ms mean, "
+                f"{stats['jitter_ms']:.2f} ms jitter, {stats['max_ms']:.2f} ms max")
@@ -0,0 +1,98 @@
+from collections import deque
+from time import perf_counter
+
+from engine.audio import UI, WALL_BOUNCE
+
+# What the governor gives up when frames overrun the budget, in this order, and takes back in reverse
+STEPS = ('fewer new balls', 'minor sounds off', 'particles off', 'half-rate rendering')
+
+
+class QualityGovernor():
+    def __init__(self, game, window=30, over=0.9, under=0.5, calm_windows=4):
+        '''Lowers the load one step at a time while the frame work overruns the frame budget'''
+        self.game = game
+        self.enabled = False
+        # Number of STEPS in effect
+        self.level = 0
+        # Frames measured before each decision
+        self.window = window
+        self.work_times = []
+        self.frame_start = None
+        # Shares of the budget that count as overrun, and as enough headroom to step back up
+        self.over = over
+        self.under = under
+        # Windows with headroom in a row before stepping back up, so it doesn't flip back and forth
+        self.calm_windows = calm_windows
+        self.calm = 0
+        # (seconds since the game started, message) of every change
+        self.log = deque(maxlen=100)
+        self.started = perf_counter()
+
+    def configure(self, enabled):
+        # Switched off, everything goes back to the full quality of the settings
+        self.enabled = enabled
+        if not enabled and self.level:
+            self.change(0, None)
+        self.apply()
+
+    def budget(self):
+        # Frame time the cap allows, 60 FPS when uncapped
+        cap = self.game.pacer.fps_cap
+        return 1 / cap if cap else 1 / 60
+
+    def start_frame(self):
+        # Idle states like the menus tick at a low rate and have nothing to give up, their frames don't count
+        self.frame_start = None if self.game.state_stack[-1].idle else perf_counter()
+
+    def end_frame(self, wait_time=0):
+        # wait_time is time spent waiting rather than working, e.g. for vsync in the flip
+        if not self.enabled or self.frame_start is None:
+            return
+        self.work_times.append(perf_counter() - self.frame_start - wait_time)
+        self.frame_start = None
+        if len(self.work_times) < self.window:
+            return
+        # The 90th percentile rather than the mean, a few long frames per second are what the player notices
+        times = sorted(self.work_times)
+        self.work_times = []
+        load = times[len(times) * 9 // 10] / self.budget()
+        if load > self.over and self.level < len(STEPS):
+            self.calm = 0
+            self.change(self.level + 1, load)
+        elif load < self.under and self.level > 0:
+            self.calm += 1
+            if self.calm >= self.calm_windows:
+                self.calm = 0
+                self.change(self.level - 1, load)
+        else:
+            self.calm = 0
+
+    def change(self, level, load):
+        if level > self.level:
+            message = f'{STEPS[level - 1]} (frame work at {load:.0%} of the budget)'
+        elif load is None:
+            message = 'full quality (governor off)'
+        else:
+            message = f'{STEPS[self.level - 1]} undone (frame work at {load:.0%} of the budget)'
+        self.log.append((perf_counter() - self.started, message))
+        self.level = level
+        self.apply()
+
+    def apply(self):
+        # Sets everything the steps touch from the settings, so it also runs after the options change
+        game, settings, level = self.game, self.game.settings, self.level
+        # A replay keeps the ball limit of the recording, whatever the settings on this machine say
+        if not game.replay:
+            game.max_balls = settings['max_balls'] if level < 1 else max(settings['max_balls'] // 4, 1)
+        game.audio.min_priority = WALL_BOUNCE if level < 2 else UI
+        game.visual_extras = level < 3
+        # The simulation keeps stepping at its fixed rate, only every other frame is drawn and presented
+        game.render_interval = 2 if level >= 4 else 1
+
+    def status(self):
+        return STEPS[self.level - 1] if self.level else 'full'
+
+    def report(self):
+        lines = [f'Quality: {self.status()}, {len(self.log)} changes']
+        lines += [f'  {time:7.1f} s  {message}' for time, message in self.log]
+        return '\n'.join(lines)
@@ -0,0 +1,147 @@
+from math import gcd
+from time import perf_counter
+
+import pygame
+
+from engine.profiler import Profiler
+
+
+class OutputStage():
+    def __init__(self, game_size, window_size, scale_mode='nearest', letterbox=True, flags=0, vsync=False,
+                 profiler=None):
+        '''Takes the internal game canvas to the window, without allocating surfaces every frame'''
+        # Times the scale and flip, a disabled profiler of its own when none is given
+        self.profiler = profiler or Profiler()
+        self.game_size = game_size
+        # 'nearest' and 'smooth' fill the window, 'integer' only uses whole-number pixel multiples
+        self.scale_mode = scale_mode
+        # Keep the game aspect ratio and fill the rest of the window with black bars
+        self.letterbox = letterbox
+        self.flags = flags
+        self.vsync = vsync
+        # Seconds the last flip took, with vsync most of it is waiting for the display
+        self.flip_time = 0
+        self.screen = self.set_mode(window_size, flags, vsync)
+        self.configure()
+
+    def set_mode(self, window_size, flags, vsync):
+        # Not every video driver can sync to the display, fall back to an unsynced window
+        if vsync:
+            try:
+                return pygame.display.set_mode(window_size, flags, vsync=1)
+            except pygame.error:
+                pass
+        return pygame.display.set_mode(window_size, flags)
+
+    def configure(self):
+        self.screen = pygame.display.get_surface()
+        window_width, window_height = self.screen.get_size()
+        game_width, game_height = self.game_size
+
+        factor = min(window_width // game_width, window_height // game_height)
+        if self.scale_mode == 'integer' and factor >= 1:
+            scaled_size = (game_width * factor, game_height * factor)
+        elif self.letterbox or self.scale_mode == 'integer':
+            # Windows smaller than the game fall back to fractional scaling
+            factor = min(window_width / game_width, window_height / game_height)
+            scaled_size = (round(game_width * factor), round(game_height * factor))
+        else:
+            scaled_size = (window_width, window_height)
+        self.dest_rect = pygame.Rect((0, 0), scaled_size)
+        self.dest_rect.center = self.screen.get_rect().center
+        self.scale_x = scaled_size[0] / game_width
+        self.scale_y = scaled_size[1] / game_height
+        # Canvas rects on this lattice land on whole window pixels, so they scale on their own to exactly the
+        # pixels scaling the whole canvas gives. Odd window sizes end up with the whole canvas as one cell
+        self.scaled_size = scaled_size
+        self.align_x = game_width // gcd(game_width, scaled_size[0])
+        self.align_y = game_height // gcd(game_height, scaled_size[1])
+
+        if self.screen.get_size() == self.game_size:
+            # Same size: the states draw straight onto the display surface
+            self.path = 'direct'
+            self.canvas = self.screen
+            self.target = None
+        else:
+            self.path = 'blit' if scaled_size == self.game_size else 'scale'
+            self.canvas = pygame.Surface(self.game_size).convert()
+            # Scale into the display itself instead of into a fresh surface every frame
+            self.screen.fill((0, 0, 0))
+            self.target = self.screen.subsurface(self.dest_rect)
+        return self.canvas
+
+    def set_window(self, window_size, vsync):
+        # Opens the window again at a new size or with vsync switched, returns the new canvas
+        self.vsync = vsync
+        self.set_mode(window_size, self.flags, vsync)
+        return self.configure()
+
+    def resize(self):
+        # Called after the window was resized, the active state has to draw a full frame again
+        return self.configure()
+
+    def present(self, dirty_rects=None):
+        # dirty_rects is a list of changed canvas rects, or None after a full redraw
+        if self.path != 'direct':
+            with self.profiler.scope('scale'):
+                self.draw_target(dirty_rects)
+
+        flip_start = perf_counter()
+        with self.profiler.scope('flip'):
+            if dirty_rects is None:
+                pygame.display.flip()
+            elif self.path == 'direct':
+                pygame.display.update(dirty_rects)
+            else:
+                pygame.display.update([self.to_window_rect(rect) for rect in dirty_rects])
+        self.flip_time = perf_counter() - flip_start
+
+    def draw_target(self, dirty_rects):
+        # Smooth scaling blends every window pixel from the canvas pixels around it in a way that doesn't
+        # line up piece by piece, so it always scales the whole canvas
+        if dirty_rects is None or (self.path == 'scale' and self.scale_mode == 'smooth'):
+            if self.path == 'blit':
+                self.target.blit(self.canvas, (0, 0))
+            elif self.scale_mode == 'smooth':
+                pygame.transform.smoothscale(self.canvas, self.target.get_size(), self.target)
+            else:
+                pygame.transform.scale(self.canvas, self.target.get_size(), self.target)
+            return
+        areas = [area for area in map(self.affected, dirty_rects) if area]
+        # Past half the canvas one scale of the whole canvas is cheaper than the pieces
+        if self.path == 'scale' and sum(area.w * area.h for area in areas) * 2 > self.game_size[0] * self.game_size[1]:
+            pygame.transform.scale(self.canvas, self.target.get_size(), self.target)
+            return
+        for area in areas:
+            if self.path == 'blit':
+                self.target.blit(self.canvas, area, area)
+            else:
+                window = self.scaled(area)
+                pygame.transform.scale(self.canvas.subsurface(area), window.size, self.target.subsurface(window))
+
+    def affected(self, rect):
+        # Canvas area of a changed rect, grown out to the lattice
+        rect = rect.clip(self.canvas.get_rect())
+        if not rect:
+            return pygame.Rect(0, 0, 0, 0)
+        left = rect.left // self.align_x * self.align_x
+        top = rect.top // self.align_y * self.align_y
+        right = min(-(-rect.right // self.align_x) * self.align_x, self.game_size[0])
+        bottom = min(-(-rect.bottom // self.align_y) * self.align_y, self.game_size[1])
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def scaled(self, rect):
+        # Target rect of a canvas rect on the lattice
+        (game_width, game_height), (width, height) = self.game_size, self.scaled_size
+        left, top = rect.left * width // game_width, rect.top * height // game_height
+        return pygame.Rect(left, top, rect.right * width // game_width - left,
+                           rect.bottom * height // game_height - top)
+
+    def to_window_rect(self, rect):
+        return self.scaled(self.affected(rect)).move(self.dest_rect.topleft)
+
+    def to_game(self, position):
+        # Map a window position (e.g. the mouse) back to canvas coordinates, clamped to the canvas
+        x = (position[0] - self.dest_rect.x) / self.scale_x
+        y = (position[1] - self.dest_rect.y) / self.scale_y
+        return (min(max(x, 0), self.game_size[0] - 1), min(max(y, 0), self.game_size[1] - 1))
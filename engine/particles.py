@@ -0,0 +1,126 @@
+import numpy as np
+import pygame
+
+# Alpha steps a particle fades through over its life
+FADE_LEVELS = 4
+# Dirty rects of the particles are whole tiles of this size
+TILE_SIZE = 32
+# Largest particle sprite, trails are 6x6 and debris 4x4
+MAX_SPRITE_SIZE = 6
+
+
+class ParticleSystem():
+    def __init__(self, capacity=1000, seed=0):
+        '''Preallocated pool of particles, updated in one vectorized pass and drawn with a single blits call'''
+        self.capacity = capacity
+        # Most particles alive at once, may be lowered below the capacity at runtime
+        self.budget = capacity
+        self.count = 0
+        self.position = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.life = np.zeros(capacity)
+        self.max_life = np.ones(capacity)
+        # Index into self.sprites of the first fade level of every particle
+        self.sprite = np.zeros(capacity, dtype=np.int64)
+        self.gravity = 900
+        self.rng = np.random.default_rng(seed)
+
+        # Fade levels of every particle look, from faintest to solid
+        self.sprites = []
+        self.looks = {}
+        self.dropped = 0
+
+    def __len__(self):
+        return self.count
+
+    def look(self, color, size):
+        # Sprites are made once per color and size
+        key = (tuple(color[:3]), size)
+        if key not in self.looks:
+            self.looks[key] = len(self.sprites)
+            for level in range(FADE_LEVELS):
+                image = pygame.Surface((size, size), pygame.SRCALPHA)
+                image.fill((*key[0], 255 * (level + 1) // FADE_LEVELS))
+                if pygame.display.get_surface() is not None:
+                    image = image.convert_alpha()
+                self.sprites.append(image)
+        return self.looks[key]
+
+    def reserve(self, count):
+        # Slots for up to count new particles, fewer when the budget is nearly used up
+        allowed = max(min(count, self.budget - self.count), 0)
+        self.dropped += count - allowed
+        start = self.count
+        self.count += allowed
+        return slice(start, self.count)
+
+    def debris(self, rect, color, count=12, speed=250, life=0.6):
+        # Fragments bursting out of a destroyed block and falling down
+        slots = self.reserve(count)
+        n = slots.stop - slots.start
+        if n == 0:
+            return
+        self.position[slots, 0] = self.rng.uniform(rect.left, rect.right, n)
+        self.position[slots, 1] = self.rng.uniform(rect.top, rect.bottom, n)
+        angle = self.rng.uniform(0, 2*np.pi, n)
+        magnitude = self.rng.uniform(0.3, 1, n) * speed
+        self.velocity[slots, 0] = np.cos(angle) * magnitude
+        self.velocity[slots, 1] = np.sin(angle) * magnitude
+        self.max_life[slots] = self.life[slots] = self.rng.uniform(0.5, 1, n) * life
+        self.sprite[slots] = self.look(color, 4)
+
+    def trail(self, positions, color=(160, 190, 255), life=0.12):
+        # One short-lived dot behind every ball, only while less than half the budget is in use
+        if self.count + len(positions) > self.budget // 2:
+            self.dropped += len(positions)
+            return
+        slots = self.reserve(len(positions))
+        n = slots.stop - slots.start
+        self.position[slots] = positions[:n]
+        self.velocity[slots] = 0
+        self.max_life[slots] = self.life[slots] = life
+        self.sprite[slots] = self.look(color, 6)
+
+    def update(self, delta_time):
+        n = self.count
+        if n == 0:
+            return
+        life = self.life[:n]
+        life -= delta_time
+        # Trails don't move, so only particles with a velocity fall
+        moving = self.velocity[:n].any(axis=1)
+        self.velocity[:n, 1][moving] += self.gravity * delta_time
+        self.position[:n] += self.velocity[:n] * delta_time
+        alive = life > 0
+        if alive.all():
+            return
+        # Compact the pool in place, like the ball engine
+        kept = np.flatnonzero(alive)
+        for array in (self.position, self.velocity, self.life, self.max_life, self.sprite):
+            array[:len(kept)] = array[kept]
+        self.count = len(kept)
+
+    def clear(self):
+        self.count = 0
+
+    def draw(self, surface):
+        n = self.count
+        if n == 0:
+            return []
+        fade = np.minimum((self.life[:n] / self.max_life[:n] * FADE_LEVELS).astype(np.int64), FADE_LEVELS - 1)
+        sprites, images = self.sprites, (self.sprite[:n] + fade).tolist()
+        positions = self.position[:n].astype(np.int64)
+        surface.blits([(sprites[i], position) for i, position in zip(images, positions.tolist())], doreturn=False)
+        return self.dirty_tiles(positions)
+
+    def dirty_tiles(self, positions):
+        # Tiles touched by any particle, far fewer rects to restore and update than one per particle
+        size = TILE_SIZE
+        top_left = np.clip(positions, 0, 4000 * size) // size
+        bottom_right = np.clip(positions + MAX_SPRITE_SIZE, 0, 4000 * size) // size
+        # A sprite can straddle up to four tiles, one per corner
+        tiles = np.unique(np.concatenate((top_left[:, 0] * 4096 + top_left[:, 1],
+                                          top_left[:, 0] * 4096 + bottom_right[:, 1],
+                                          bottom_right[:, 0] * 4096 + top_left[:, 1],
+                                          bottom_right[:, 0] * 4096 + bottom_right[:, 1])))
+        return [pygame.Rect(x * size, y * size, size, size) for x, y in zip((tiles // 4096).tolist(), (tiles % 4096).tolist())]
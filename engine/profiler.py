@@ -0,0 +1,177 @@
+import csv, json
+from collections import deque
+from time import perf_counter
+
+import pygame
+
+
+class NullScope():
+    # Shared do-nothing scope handed out while profiling is off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SCOPE = NullScope()
+
+
+class Scope():
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, perf_counter())
+        return False
+
+
+class Profiler():
+    def __init__(self, history=240, trace_limit=200000):
+        '''Named timing scopes, summed per frame into fixed-size ring buffers'''
+        self.enabled = False
+        self.history = history
+        self.frame_times = deque(maxlen=history)
+        # Scope name -> time spent in it per frame, aligned with frame_times
+        self.scopes = {}
+        self.current = {}
+        self.frame_start = None
+        # Every single scope as (name, start, duration), kept for the Chrome trace export
+        self.trace = deque(maxlen=trace_limit)
+        self.origin = perf_counter()
+
+    def scope(self, name):
+        # Usage: with game.profiler.scope('render'): ...
+        if not self.enabled:
+            return NULL_SCOPE
+        return Scope(self, name)
+
+    def record(self, name, start, end):
+        self.current[name] = self.current.get(name, 0) + end - start
+        self.trace.append((name, start, end - start))
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        # Don't count the time profiling was off as one long frame
+        self.frame_start = None
+        self.current = {}
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        now = perf_counter()
+        # Swapped out first, the simulation thread may still record scopes while this frame is summed up
+        current, self.current = self.current, {}
+        if self.frame_start is not None:
+            self.frame_times.append(now - self.frame_start)
+            self.trace.append(('frame', self.frame_start, now - self.frame_start))
+            for name in list(current):
+                if name not in self.scopes:
+                    # A new scope starts out as zero in the frames before it first ran
+                    self.scopes[name] = deque([0] * (len(self.frame_times) - 1), maxlen=self.history)
+            for name, times in list(self.scopes.items()):
+                times.append(current.get(name, 0))
+        self.frame_start = now
+
+    def averages(self):
+        # Mean milliseconds per frame of the frame itself and every scope over the history
+        stats = {}
+        for name, times in [('frame', self.frame_times)] + list(self.scopes.items()):
+            if times:
+                stats[name] = (sum(times) / len(times) * 1000, max(times) * 1000)
+        return stats
+
+    def export_csv(self, path):
+        # One row per frame in the history, times in milliseconds
+        names = list(self.scopes)
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['frame_ms'] + [f'{name}_ms' for name in names])
+            for i, frame_time in enumerate(self.frame_times):
+                writer.writerow([f'{frame_time * 1000:.4f}'] + [f'{self.scopes[name][i] * 1000:.4f}' for name in names])
+
+    def export_chrome_trace(self, path):
+        # Open in chrome://tracing or https://ui.perfetto.dev
+        events = [{'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                   'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6}
+                  for name, start, duration in self.trace]
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+
+class ProfilerOverlay():
+    def __init__(self, game, position=(50, 90), size=(400, 300)):
+        '''On-screen frame time graph and scope timings, drawn over the active state'''
+        self.game = game
+        self.profiler = game.profiler
+        self.rect = pygame.Rect(position, size)
+        self.font = game.load_font('PilotCommand-3zn93.ttf', 18)
+        self.panel = pygame.Surface(size, pygame.SRCALPHA)
+        # Canvas pixels under the overlay, put back before the state draws its next frame
+        self.saved = pygame.Surface(size)
+        self.saved_rect = None
+        # The text only changes a few times per second, the graph every frame
+        self.text_interval = 15
+        self.frames = 0
+        self.text_lines = []
+
+    def restore(self, canvas):
+        # Returns the rect that changed, or None when the overlay wasn't drawn last frame
+        if self.saved_rect is None:
+            return None
+        rect = canvas.blit(self.saved, self.saved_rect)
+        self.saved_rect = None
+        return rect
+
+    def draw(self, canvas, state):
+        if self.frames % self.text_interval == 0:
+            self.text_lines = [self.font.render(line, True, (255, 255, 255)) for line in self.lines(state)]
+        self.frames += 1
+
+        panel = self.panel
+        panel.fill((0, 0, 0, 190))
+        y = 6
+        for line in self.text_lines:
+            panel.blit(line, (8, y))
+            y += line.get_height()
+        self.draw_graph(panel, pygame.Rect(8, y + 6, self.rect.width - 16, self.rect.height - y - 14))
+
+        self.saved.blit(canvas, (0, 0), self.rect)
+        self.saved_rect = self.rect
+        return canvas.blit(panel, self.rect)
+
+    def lines(self, state):
+        stats = self.profiler.averages()
+        frame_ms, frame_max = stats.pop('frame', (0, 0))
+        lines = [f'{1000 / frame_ms if frame_ms else 0:.0f} FPS  {frame_ms:.2f} ms  max {frame_max:.2f} ms']
+        for name, (average, peak) in stats.items():
+            lines.append(f'{name:<18} {average:6.2f} ms  max {peak:6.2f}')
+        counts = state.profile_counts()
+        if counts:
+            lines.append('  '.join(f'{name} {count}' for name, count in counts.items()))
+        if pygame.mixer.get_init():
+            channels = pygame.mixer.get_num_channels()
+            busy = sum(pygame.mixer.Channel(i).get_busy() for i in range(channels))
+            lines.append(f'sound channels {busy}/{channels}')
+        governor = self.game.governor
+        if governor.enabled:
+            lines.append(f'quality {governor.status()}')
+        return lines
+
+    def draw_graph(self, panel, area):
+        if area.height <= 0 or not self.profiler.frame_times:
+            return
+        # Full height is 33.3 ms, the line marks 16.7 ms (60 FPS)
+        scale = area.height / (1 / 30)
+        bar_width = area.width / self.profiler.history
+        for i, frame_time in enumerate(self.profiler.frame_times):
+            height = min(frame_time * scale, area.height)
+            color = (90, 200, 90) if frame_time <= 1 / 60 else (230, 90, 70)
+            panel.fill(color, (area.x + int(i * bar_width), area.bottom - height, max(int(bar_width), 1), height))
+        pygame.draw.line(panel, (255, 255, 255, 120), (area.x, area.bottom - area.height / 2),
+                         (area.right, area.bottom - area.height / 2))
@@ -0,0 +1,96 @@
+import gzip, struct
+
+MAGIC = b'PKRC'
+VERSION = 2
+# Magic and version, the same in every version
+SIGNATURE = '<4sH'
+# Magic, version, seed of the game RNG, then the settings that change the simulation: the ball limit
+HEADER = '<4sHQH'
+# Version 1 recordings only have the seed, they were made with the default ball limit
+HEADER_V1 = '<4sHQ'
+# Frame time and number of input changes that frame
+FRAME = '<dH'
+# Kind, then two values: key index and state, or the mouse x and y
+DELTA = '<Bhh'
+
+# Keys of Game.keys in the order they are numbered in a recording
+KEY_NAMES = ('up', 'down', 'left', 'right', 'space', 'enter', 'escape')
+MOUSE_MOVE = len(KEY_NAMES)
+MOUSE_BUTTON = MOUSE_MOVE + 1
+# The ball limit changed on the options screen
+MAX_BALLS = MOUSE_BUTTON + 1
+
+
+def encode_delta(delta):
+    name, value = delta
+    if name == 'mouse':
+        return struct.pack(DELTA, MOUSE_MOVE, *value)
+    if name == 'button':
+        return struct.pack(DELTA, MOUSE_BUTTON, value, 0)
+    if name == 'max_balls':
+        return struct.pack(DELTA, MAX_BALLS, value, 0)
+    return struct.pack(DELTA, KEY_NAMES.index(name), value, 0)
+
+
+def decode_delta(data, offset):
+    kind, a, b = struct.unpack_from(DELTA, data, offset)
+    if kind == MOUSE_MOVE:
+        return ('mouse', (a, b))
+    if kind == MOUSE_BUTTON:
+        return ('button', bool(a))
+    if kind == MAX_BALLS:
+        return ('max_balls', a)
+    return (KEY_NAMES[kind], bool(a))
+
+
+class InputRecorder():
+    def __init__(self, path, seed, max_balls):
+        '''Writes the frame time and the input changes of every frame, gzip compressed'''
+        self.path = path
+        self.file = gzip.open(path, 'wb')
+        self.file.write(struct.pack(HEADER, MAGIC, VERSION, seed, max_balls))
+        self.frames = 0
+        # Setting changes, written with the input of the next frame
+        self.pending = []
+
+    def record_ball_limit(self, max_balls):
+        self.pending.append(('max_balls', max_balls))
+
+    def record_frame(self, delta_time, deltas):
+        deltas = deltas + self.pending
+        self.pending = []
+        self.file.write(struct.pack(FRAME, delta_time, len(deltas)) + b''.join(map(encode_delta, deltas)))
+        self.frames += 1
+
+    def close(self):
+        self.file.close()
+
+
+class InputPlayback():
+    def __init__(self, path):
+        '''Reads a recording back as (frame time, input changes) per frame'''
+        with gzip.open(path, 'rb') as file:
+            self.data = file.read()
+        magic, version = struct.unpack_from(SIGNATURE, self.data)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f'{path} is not a version 1-{VERSION} input recording')
+        # None keeps the default ball limit
+        self.max_balls = None
+        if version == 1:
+            _, _, self.seed = struct.unpack_from(HEADER_V1, self.data)
+            self.frames_start = struct.calcsize(HEADER_V1)
+        else:
+            _, _, self.seed, self.max_balls = struct.unpack_from(HEADER, self.data)
+            self.frames_start = struct.calcsize(HEADER)
+
+    def __iter__(self):
+        data, offset = self.data, self.frames_start
+        frame_size, delta_size = struct.calcsize(FRAME), struct.calcsize(DELTA)
+        while offset < len(data):
+            delta_time, count = struct.unpack_from(FRAME, data, offset)
+            offset += frame_size
+            deltas = []
+            for _ in range(count):
+                deltas.append(decode_delta(data, offset))
+                offset += delta_size
+            yield delta_time, deltas
@@ -0,0 +1,62 @@
+class Timer():
+    def __init__(self, duration, callback=None, on_update=None):
+        self.duration = duration
+        self.elapsed = 0
+        # Called once when the timer runs out
+        self.callback = callback
+        # Called every update with the progress from 0 to 1, used for tweens
+        self.on_update = on_update
+        self.active = True
+
+    @property
+    def progress(self):
+        return min(self.elapsed / self.duration, 1) if self.duration else 1
+
+    def advance(self, delta_time):
+        self.elapsed += delta_time
+        if self.on_update:
+            self.on_update(self.progress)
+        if self.elapsed >= self.duration:
+            self.finish()
+
+    def finish(self):
+        # Run the callback right away, e.g. when the player skips a pause
+        if not self.active:
+            return
+        self.active = False
+        self.elapsed = self.duration
+        if self.callback:
+            self.callback()
+
+    def cancel(self):
+        self.active = False
+
+
+class Scheduler():
+    def __init__(self):
+        '''Timed callbacks and tweens advanced by the game loop instead of blocking it with sleep()'''
+        self.timers = []
+        # Scales the time every timer sees, e.g. 2 plays every pause twice as fast
+        self.speed = 1
+
+    def after(self, delay, callback):
+        timer = Timer(delay, callback)
+        self.timers.append(timer)
+        return timer
+
+    def tween(self, duration, on_update, on_done=None):
+        timer = Timer(duration, on_done, on_update)
+        self.timers.append(timer)
+        return timer
+
+    def update(self, delta_time):
+        # Timers added by callbacks start on the next update
+        for timer in list(self.timers):
+            if timer.active:
+                timer.advance(delta_time * self.speed)
+        self.timers = [timer for timer in self.timers if timer.active]
+
+    def cancel_all(self):
+        for timer in self.timers:
+            timer.cancel()
+        self.timers = []
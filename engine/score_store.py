@@ -0,0 +1,81 @@
+import queue, sqlite3, threading, time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    player TEXT NOT NULL,
+    stage_set TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    stage INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC);
+CREATE INDEX IF NOT EXISTS scores_by_stage_set ON scores (stage_set, score DESC);
+CREATE INDEX IF NOT EXISTS scores_by_player ON scores (player, score DESC);
+'''
+
+
+class ScoreStore():
+    def __init__(self, path='scores.db'):
+        '''High scores in SQLite. Reads run on the caller's thread, writes are queued to a background thread'''
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        # Write-ahead logging lets the menu read while the writer thread commits
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def submit(self, player, stage_set, score, stage):
+        # Returns right away, the row is written by the writer thread
+        self.queue.put((player, stage_set, score, stage, time.time()))
+
+    def write_loop(self):
+        connection = sqlite3.connect(self.path)
+        while True:
+            rows = [self.queue.get()]
+            # Everything queued meanwhile goes into the same transaction
+            while not self.queue.empty():
+                rows.append(self.queue.get())
+            done = None in rows
+            rows = [row for row in rows if row is not None]
+            if rows:
+                connection.executemany('INSERT INTO scores (player, stage_set, score, stage, created) '
+                                       'VALUES (?, ?, ?, ?, ?)', rows)
+                connection.commit()
+            if done:
+                connection.close()
+                return
+
+    def where(self, stage_set, player):
+        clauses, parameters = [], []
+        if stage_set is not None:
+            clauses.append('stage_set = ?')
+            parameters.append(stage_set)
+        if player is not None:
+            clauses.append('player = ?')
+            parameters.append(player)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), parameters
+
+    def top(self, limit=10, offset=0, stage_set=None, player=None):
+        # One page of (player, stage set, score, stage), best first, read through the matching index
+        where, parameters = self.where(stage_set, player)
+        return self.connection.execute(f'SELECT player, stage_set, score, stage FROM scores{where} '
+                                       'ORDER BY score DESC, id LIMIT ? OFFSET ?',
+                                       parameters + [limit, offset]).fetchall()
+
+    def count(self, stage_set=None, player=None):
+        where, parameters = self.where(stage_set, player)
+        return self.connection.execute(f'SELECT COUNT(*) FROM scores{where}', parameters).fetchone()[0]
+
+    def stage_sets(self):
+        return [row[0] for row in self.connection.execute('SELECT DISTINCT stage_set FROM scores ORDER BY stage_set')]
+
+    def close(self):
+        # Waits until every submitted score is written
+        self.queue.put(None)
+        self.writer.join()
+        self.connection.close()
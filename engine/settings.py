@@ -0,0 +1,75 @@
+import json
+from pathlib import Path
+
+# Every setting with the values the options screen cycles through, the first value is not the default
+CHOICES = {
+    'resolution': [(640, 480), (960, 720), (1280, 960), (1600, 1200), (1920, 1440)],
+    'fps_cap': [30, 60, 120, 144, 240, 0],
+    'vsync': [False, True],
+    'scale_mode': ['nearest', 'smooth', 'integer'],
+    'audio_buffer': [128, 256, 512, 1024, 2048],
+    'audio_channels': [8, 16, 32],
+    'max_balls': [50, 100, 200, 500, 1000],
+    'fps_overlay': [False, True],
+    'sim_thread': [False, True],
+    'auto_quality': [False, True],
+}
+
+DEFAULTS = {'resolution': (1280, 960), 'fps_cap': 144, 'vsync': False, 'scale_mode': 'nearest',
+            'audio_buffer': 256, 'audio_channels': 16, 'max_balls': 200, 'fps_overlay': False,
+            'sim_thread': False, 'auto_quality': True}
+
+# The window size is left out, the game always renders at 1280x960 and only the output is scaled to the window
+PRESETS = {
+    'LOW': {'fps_cap': 60, 'vsync': False, 'scale_mode': 'nearest', 'audio_buffer': 1024, 'audio_channels': 8,
+            'max_balls': 50},
+    'BALANCED': {'fps_cap': 144, 'vsync': False, 'scale_mode': 'nearest', 'audio_buffer': 256, 'audio_channels': 16,
+                 'max_balls': 200},
+    'HIGH': {'fps_cap': 240, 'vsync': False, 'scale_mode': 'smooth', 'audio_buffer': 128, 'audio_channels': 32,
+             'max_balls': 1000},
+}
+
+
+class Settings():
+    def __init__(self, path='settings.json'):
+        '''Performance settings, read from a JSON file and written back whenever they change'''
+        # None keeps the defaults and never touches the disk, e.g. for headless runs
+        self.path = Path(path) if path else None
+        self.values = dict(DEFAULTS)
+        if self.path and self.path.exists():
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return
+        for name, value in saved.items():
+            value = tuple(value) if isinstance(value, list) else value
+            # Values the game doesn't offer (any more) keep their default
+            if name in CHOICES and value in CHOICES[name]:
+                self.values[name] = value
+
+    def save(self):
+        if self.path:
+            with open(self.path, 'w') as file:
+                json.dump(self.values, file, indent=2)
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def cycle(self, name, step):
+        # Move to the next or previous choice of a setting
+        choices = CHOICES[name]
+        self.values[name] = choices[(choices.index(self.values[name]) + step) % len(choices)]
+
+    def preset(self):
+        # Name of the preset the current values match, or None for custom settings
+        for name, preset in PRESETS.items():
+            if all(self.values[setting] == value for setting, value in preset.items()):
+                return name
+        return None
+
+    def apply_preset(self, name):
+        self.values.update(PRESETS[name])
@@ -0,0 +1,95 @@
+import queue, sys, threading
+from collections import namedtuple
+from time import perf_counter, sleep
+
+# What the renderer needs of one simulation step. Never changed once published, so it can be read from
+# the render thread without a lock. balls are the centers of every ball as a read-only (n, 2) array
+Snapshot = namedtuple('Snapshot', 'time player_x balls blocks blocks_version score lives message trails')
+
+
+class SnapshotBuffer():
+    def __init__(self, snapshot):
+        '''The two newest snapshots, swapped under a lock: the renderer interpolates between them'''
+        self.lock = threading.Lock()
+        self.previous = self.latest = snapshot
+        self.published = 0
+
+    def publish(self, snapshot):
+        with self.lock:
+            self.previous, self.latest = self.latest, snapshot
+            self.published += 1
+
+    def read(self):
+        # Always a consistent pair, never one old and one new snapshot from different publishes
+        with self.lock:
+            return self.previous, self.latest
+
+    def interpolation(self, now):
+        # Both snapshots and how far to blend from the previous to the latest, rendering one step behind
+        previous, latest = self.read()
+        step = latest.time - previous.time
+        if step <= 0:
+            return previous, latest, 1
+        return previous, latest, min(max((now - latest.time) / step, 0), 1)
+
+
+class SimulationThread():
+    def __init__(self, game, state):
+        '''Runs one state's update at the fixed rate on its own thread, the main thread only renders'''
+        self.game = game
+        self.state = state
+        # Input changes from the main thread, applied at the start of the next step
+        self.inputs = queue.SimpleQueue()
+        self.buffer = SnapshotBuffer(state.snapshot(perf_counter()))
+        state.snapshots = self.buffer
+        self.running = True
+        self.steps = 0
+        self.late_steps = 0
+        # The render thread holds the GIL for up to this long at a time, the default 5 ms is more than a step
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(0.0005)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def push_input(self, deltas):
+        if deltas:
+            self.inputs.put(deltas)
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def run(self):
+        game, state = self.game, self.state
+        next_step = perf_counter()
+        while self.running:
+            while not self.inputs.empty():
+                game.apply_input(self.inputs.get())
+            game.scheduler.update(game.fixed_dt)
+            with game.profiler.scope(state.update_scope):
+                state.update(game.fixed_dt, game.keys)
+            game.audio.flush()
+            self.buffer.publish(state.snapshot(perf_counter()))
+            self.steps += 1
+            # The state left the stack (game over, escape), the main thread takes over again
+            if game.state_stack[-1] is not state:
+                break
+
+            next_step += game.fixed_dt
+            delay = next_step - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            else:
+                self.late_steps += 1
+                # Too far behind to catch up, e.g. after the window was dragged: start counting from now
+                if delay < -0.25:
+                    next_step = perf_counter()
+        sys.setswitchinterval(self.switch_interval)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def drain_inputs(self):
+        # Input that arrived after the thread stopped goes to the main thread's update instead
+        while not self.inputs.empty():
+            self.game.apply_input(self.inputs.get())
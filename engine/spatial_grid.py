@@ -0,0 +1,48 @@
+class BlockGrid():
+    def __init__(self, x, y, cell_width, cell_height, cols, rows):
+        # Blocks always sit on a fixed lattice, so every block owns exactly one cell
+        self.x, self.y = x, y
+        self.cell_width, self.cell_height = cell_width, cell_height
+        self.cols, self.rows = cols, rows
+        self.cells = [None] * (cols * rows)
+        # One byte per cell, cheap to view as an array for vectorized broad phases
+        self.occupied = bytearray(cols * rows)
+
+    def cell_index(self, x, y):
+        col = (x - self.x) // self.cell_width
+        row = (y - self.y) // self.cell_height
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return row * self.cols + col
+        return None
+
+    def add(self, block):
+        index = self.cell_index(block.rect.left, block.rect.top)
+        if index is None:
+            raise ValueError(f'Block at {block.rect.topleft} is outside of the block grid')
+        self.cells[index] = block
+        self.occupied[index] = 1
+
+    def remove(self, block):
+        index = self.cell_index(block.rect.left, block.rect.top)
+        if index is not None and self.cells[index] is block:
+            self.cells[index] = None
+            self.occupied[index] = 0
+
+    def clear(self):
+        self.cells = [None] * (self.cols * self.rows)
+        self.occupied[:] = bytes(self.cols * self.rows)
+
+    def query(self, rect):
+        # Only look at the cells the rect overlaps instead of every block on the stage
+        first_col = max((rect.left - self.x) // self.cell_width, 0)
+        last_col = min((rect.right - 1 - self.x) // self.cell_width, self.cols - 1)
+        first_row = max((rect.top - self.y) // self.cell_height, 0)
+        last_row = min((rect.bottom - 1 - self.y) // self.cell_height, self.rows - 1)
+
+        blocks = []
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                block = self.cells[row * self.cols + col]
+                if block is not None and block.rect.colliderect(rect):
+                    blocks.append(block)
+        return blocks
@@ -0,0 +1,151 @@
+import mmap, os, struct, sys, tempfile
+from csv import reader
+from pathlib import Path
+
+# Pack layout (little endian):
+#   header        magic, version, rows, cols, stage count, code count
+#   code table    one length-prefixed ASCII string per block code, ID = position + 1
+#   offset table  one uint32 file offset per stage
+#   stage data    rows*cols uint8 block IDs per stage, 0 means empty cell
+MAGIC = b'PKSP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHHH')
+OFFSET = struct.Struct('<I')
+
+STAGE_ROWS, STAGE_COLS = 20, 20
+BLOCK_CODES = ('STD1', 'STD2', 'STD3', 'STD4', 'STD5', 'SPD1', 'SLD1', 'ICE1', 'BSHI1')
+
+
+def read_csv_rows(path):
+    with open(path, newline='') as file:
+        return list(reader(file, delimiter=';'))
+
+
+def read_xlsx_rows(path, sheet=None):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError('Compiling .xlsx stage sets requires openpyxl (pip install openpyxl)') from None
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    worksheet = workbook[sheet] if sheet else workbook.active
+    rows = [['' if cell is None else str(cell).strip() for cell in row] for row in worksheet.iter_rows(values_only=True)]
+    workbook.close()
+    return rows
+
+
+def parse_stages(rows, source='<rows>'):
+    # Every stage is a separator row starting with 'x' followed by STAGE_ROWS rows of block codes
+    ids = {code: i + 1 for i, code in enumerate(BLOCK_CODES)}
+    stages = []
+    row_index = 0
+    while row_index < len(rows):
+        row = rows[row_index]
+        if not row or row[0].strip().lower() != 'x':
+            raise ValueError(f'{source}: expected stage separator on line {row_index + 1}')
+        layout = rows[row_index + 1:row_index + 1 + STAGE_ROWS]
+        # A trailing separator closes the last stage
+        if not layout:
+            break
+        if len(layout) < STAGE_ROWS:
+            raise ValueError(f'{source}: stage {len(stages) + 1} has only {len(layout)} rows')
+
+        data = bytearray(STAGE_ROWS * STAGE_COLS)
+        for i, layout_row in enumerate(layout):
+            for j, cell in enumerate(layout_row[:STAGE_COLS]):
+                cell = cell.strip().upper()
+                if not cell:
+                    continue
+                if cell not in ids:
+                    raise ValueError(f'{source}: unknown block code {cell!r} in stage {len(stages) + 1}, '
+                                     f'row {i + 1}, column {j + 1}')
+                data[i*STAGE_COLS + j] = ids[cell]
+        stages.append(bytes(data))
+        row_index += STAGE_ROWS + 1
+    return stages
+
+
+def compile_stage_set(source, destination=None, sheet=None):
+    source = Path(source)
+    destination = Path(destination) if destination else source.with_suffix('.pkpack')
+    if source.suffix.lower() == '.xlsx':
+        rows = read_xlsx_rows(source, sheet)
+    else:
+        rows = read_csv_rows(source)
+    stages = parse_stages(rows, source)
+
+    code_table = b''.join(bytes([len(code)]) + code.encode('ascii') for code in BLOCK_CODES)
+    data_start = HEADER.size + len(code_table) + OFFSET.size*len(stages)
+    offsets = b''.join(OFFSET.pack(data_start + i*STAGE_ROWS*STAGE_COLS) for i in range(len(stages)))
+
+    # Written next to the pack and moved over it, so a reader never maps a half written file. Every compile gets
+    # a file of its own, the warm-up thread and the main thread can compile the same pack at the same time
+    handle, temporary = tempfile.mkstemp(suffix='.tmp', prefix=f'{destination.name}.', dir=destination.parent)
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, STAGE_ROWS, STAGE_COLS, len(stages), len(BLOCK_CODES)))
+            file.write(code_table)
+            file.write(offsets)
+            file.write(b''.join(stages))
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return destination
+
+
+class StagePack():
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.rows, self.cols, self.stage_count, code_count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{self.path}: not a version {VERSION} stage pack')
+
+        # Resolve the code table once so stages only carry small integer IDs
+        self.codes = [None]
+        position = HEADER.size
+        for _ in range(code_count):
+            length = self.data[position]
+            self.codes.append(self.data[position + 1:position + 1 + length].decode('ascii'))
+            position += 1 + length
+        self.offsets_start = position
+
+    def __len__(self):
+        return self.stage_count
+
+    def stage_ids(self, stage):
+        # Stages are numbered from 1, like GameLevel.stage
+        if not 1 <= stage <= self.stage_count:
+            raise IndexError(f'{self.path}: stage {stage} out of range 1-{self.stage_count}')
+        offset = OFFSET.unpack_from(self.data, self.offsets_start + (stage - 1)*OFFSET.size)[0]
+        return self.data[offset:offset + self.rows*self.cols]
+
+    def blocks(self, stage):
+        # Yield (row, column, code) for every non-empty cell of the stage
+        ids = self.stage_ids(stage)
+        for index, block_id in enumerate(ids):
+            if block_id:
+                yield index // self.cols, index % self.cols, self.codes[block_id]
+
+    def close(self):
+        self.data.close()
+
+
+def load_stage_pack(source):
+    # Accept either a compiled pack or a stage set, recompiling the pack whenever the set is newer
+    source = Path(source)
+    if source.suffix == '.pkpack':
+        return StagePack(source)
+    pack_path = source.with_suffix('.pkpack')
+    if not pack_path.exists() or pack_path.stat().st_mtime < source.stat().st_mtime:
+        compile_stage_set(source, pack_path)
+    return StagePack(pack_path)
+
+
+if __name__ == '__main__':
+    # Usage: python -m engine.stage_pack <stage set .csv/.xlsx> [output .pkpack]
+    pack = compile_stage_set(*sys.argv[1:3])
+    print(f'{pack}: {len(StagePack(pack))} stages')
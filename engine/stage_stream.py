@@ -0,0 +1,91 @@
+import queue, threading
+
+from engine.stage_pack import BLOCK_CODES, STAGE_COLS
+
+
+def pack_stages(pack, first=1):
+    # (stage number, layout) from first on, starting over from the first stage once the set is cleared
+    stage = first
+    while True:
+        yield stage, list(pack.blocks((stage - 1) % len(pack) + 1))
+        stage += 1
+
+
+def endless_stages(packs, rng, first=1):
+    # Every non-empty stage of the packs in turn, each followed by a generated one, for as long as the run lasts.
+    # Stages before first are generated too and skipped, so a stage number always gets the same layout from rng
+    layouts = [(pack, i) for pack in packs for i in range(1, len(pack) + 1) if any(pack.stage_ids(i))]
+    stage = 1
+    while True:
+        for pack, i in layouts:
+            if stage >= first:
+                yield stage, list(pack.blocks(i))
+            layout = procedural_layout(rng)
+            if stage + 1 >= first:
+                yield stage + 1, layout
+            stage += 2
+        if not layouts:
+            layout = procedural_layout(rng)
+            if stage >= first:
+                yield stage, layout
+            stage += 1
+
+
+def procedural_layout(rng, rows=12):
+    # Random rows of blocks, mirrored so the stage is symmetric
+    layout = []
+    half = STAGE_COLS // 2
+    for row in range(rows):
+        if rng.random() < 0.25:
+            continue
+        code = rng.choice(BLOCK_CODES)
+        density = rng.uniform(0.4, 1)
+        for col in range(half):
+            if rng.random() < density:
+                layout.append((row, col, code))
+                layout.append((row, STAGE_COLS - 1 - col, code))
+    return layout
+
+
+class StagePrefetcher():
+    def __init__(self, source, build, depth=2):
+        '''Builds the next stages on a worker thread, so switching stages is only a swap'''
+        self.source = source
+        # Turns a layout into what the level places, e.g. its Block sprites
+        self.build = build
+        # Bounded, so memory stays flat however many stages the source produces
+        self.queue = queue.Queue(maxsize=depth)
+        self.running = True
+        self.worker = threading.Thread(target=self.fill, daemon=True)
+        self.worker.start()
+
+    def fill(self):
+        try:
+            for stage, layout in self.source:
+                if not self.put((stage, self.build(layout))):
+                    return
+        except Exception as error:
+            # Handed over to the level, which raises it on the next stage switch instead of waiting forever
+            self.put(error)
+
+    def put(self, item):
+        # False once the prefetcher is closed
+        while self.running:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def next(self):
+        # (stage number, built stage), waits only if the worker hasn't got there yet
+        item = self.queue.get()
+        if isinstance(item, Exception):
+            # The worker is gone, later calls raise the same error
+            self.queue.put(item)
+            raise item
+        return item
+
+    def close(self):
+        self.running = False
@@ -0,0 +1,31 @@
+from collections import OrderedDict
+
+
+class TextCache():
+    def __init__(self, capacity=256):
+        # Rendered text surfaces, least recently used first
+        self.surfaces = OrderedDict()
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+    def report(self):
+        return f'Text cache: {len(self.surfaces)} surfaces, {self.hits} hits, {self.misses} misses'
@@ -0,0 +1,340 @@
+import random
+from math import cos, sin
+from math import pi as PI
+from pathlib import PurePath
+
+import numpy as np
+
+from engine.ball_engine import round_half_away
+from engine.collision import MAX_BOUNCES
+from engine.stage_pack import STAGE_COLS, STAGE_ROWS, load_stage_pack
+
+# Same playfield as GameLevel: side walls 40 px wide, blocks on a 60x30 lattice starting at (40, 80)
+GAME_WIDTH, GAME_HEIGHT = 1280, 960
+WALL = 40
+GRID_X, GRID_Y, CELL_WIDTH, CELL_HEIGHT = 40, 80, 60, 30
+# Sizes of ball.png and paddle.png, the paddle's bottom sits 14 px above the bottom edge
+BALL_SIZE = 18
+PADDLE_WIDTH, PADDLE_HEIGHT = 146, 28
+PADDLE_TOP = GAME_HEIGHT - 14 - PADDLE_HEIGHT
+MIN_SPEED, MAX_SPEED = 300, 1000
+
+# Block kinds, looked up from the stage pack's block codes
+STANDARD, SPEED_UP, SLOW_DOWN, ICE, BOTTOM_SHIELD = range(5)
+KINDS = {'STD': STANDARD, 'SPD': SPEED_UP, 'SLD': SLOW_DOWN, 'ICE': ICE, 'BSHI': BOTTOM_SHIELD}
+
+# Faces of a target a ball can hit, as collision.sweep names them
+LEFT, RIGHT, TOP, BOTTOM = range(4)
+# Targets every ball is tested against in one pass, in the order find_hits collects them:
+# right, left and top wall, the paddle, then up to 2x2 block cells row by row
+WALL_TARGETS, PADDLE_TARGET, BLOCK_TARGETS = 3, 3, 4
+
+
+def sweep(box, dx, dy, targets):
+    '''collision.sweep for many boxes against many targets at once. box is (m, 4), dx and dy (m,),
+    targets (m, t, 4), all as (left, top, right, bottom). Returns the (m, t) time and side of every
+    contact and whether there is one.'''
+    left, top, right, bottom = (box[:, i, None] for i in range(4))
+    dx, dy = dx[:, None], dy[:, None]
+    target_left, target_top, target_right, target_bottom = (targets[..., i] for i in range(4))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_entry = np.where(dx > 0, (target_left - right) / dx, np.where(dx < 0, (target_right - left) / dx, -np.inf))
+        x_exit = np.where(dx > 0, (target_right - left) / dx, np.where(dx < 0, (target_left - right) / dx, np.inf))
+        y_entry = np.where(dy > 0, (target_top - bottom) / dy, np.where(dy < 0, (target_bottom - top) / dy, -np.inf))
+        y_exit = np.where(dy > 0, (target_bottom - top) / dy, np.where(dy < 0, (target_top - bottom) / dy, np.inf))
+    miss = (((dx == 0) & ((right <= target_left) | (left >= target_right)))
+            | ((dy == 0) & ((bottom <= target_top) | (top >= target_bottom))))
+    entry, exit = np.maximum(x_entry, y_entry), np.minimum(x_exit, y_exit)
+    x_axis = x_entry > y_entry
+    hit = (~miss & (entry < exit) & (entry <= 1) & (exit > 0) & (entry != -np.inf)
+           & np.where(x_axis, dx != 0, dy != 0))
+    side = np.where(x_axis, np.where(dx > 0, LEFT, RIGHT), np.where(dy > 0, TOP, BOTTOM))
+    return np.maximum(entry, 0), side, hit
+
+
+class VectorEnv():
+    def __init__(self, count, stage_set=PurePath('stages', 'test_set1.csv'), stages=(1,), seed=0, max_balls=200,
+                 max_steps=240*120, dt=1/240):
+        '''count GameLevels without a display, kept in NumPy arrays and stepped together. Each game is one
+        life on one stage: it ends when the last ball is lost, the stage is cleared or max_steps run out.'''
+        self.count = count
+        self.dt = dt
+        self.max_balls = max_balls
+        self.max_steps = max_steps
+        # Game i plays stages[i % len(stages)]
+        pack = load_stage_pack(stage_set)
+        kinds = [-1] + [KINDS[code.rstrip('0123456789')] for code in pack.codes[1:]]
+        self.layouts = np.stack([np.frombuffer(pack.stage_ids(stage), dtype=np.uint8).reshape(STAGE_ROWS, STAGE_COLS)
+                                 for stage in stages])
+        self.stages = np.array([stages[i % len(stages)] for i in range(count)])
+        self.layout_index = np.arange(count) % len(stages)
+        pack.close()
+        # Block kind of every block ID, 0 is an empty cell
+        self.kind_of = np.array(kinds)
+        # Seeds every game's level seed, like Game.rng does for GameLevel
+        self.seeder = random.Random(seed)
+
+        self.blocks = np.zeros((count, STAGE_ROWS, STAGE_COLS), dtype=np.uint8)
+        self.blocks_left = np.zeros(count, dtype=np.int64)
+        self.paddle_left = np.zeros(count, dtype=np.int64)
+        self.score = np.zeros(count, dtype=np.int64)
+        self.steps = np.zeros(count, dtype=np.int64)
+        self.rngs = [None] * count
+        self.seeds = np.zeros(count, dtype=np.int64)
+        # Balls of every game, packed at the front of their row in spawn order, like BallEngine
+        self.ball_count = np.zeros(count, dtype=np.int64)
+        self.position = np.zeros((count, 4, 2))
+        self.velocity = np.zeros((count, 4, 2))
+        self.speed = np.zeros((count, 4))
+        self.angle = np.zeros((count, 4))
+        self.alive = np.zeros((count, 4), dtype=bool)
+        # Balls lost in this step's first pass, before the balls near blocks moved
+        self.lost_early = np.zeros((count, 4), dtype=bool)
+
+    def reset(self):
+        self.reset_games(np.ones(self.count, dtype=bool))
+        return self.observe()
+
+    def reset_games(self, mask):
+        games = np.flatnonzero(mask)
+        for i in games.tolist():
+            self.seeds[i] = self.seeder.getrandbits(32)
+            self.rngs[i] = random.Random(int(self.seeds[i]))
+        self.blocks[games] = self.layouts[self.layout_index[games]]
+        self.blocks_left[games] = np.count_nonzero(self.blocks[games], axis=(1, 2))
+        self.paddle_left[games] = GAME_WIDTH // 2 - PADDLE_WIDTH // 2
+        self.score[games] = 0
+        self.steps[games] = 0
+        self.alive[games] = False
+        self.ball_count[games] = 0
+        # The first ball sits on the paddle and leaves it on the first step
+        for i in games.tolist():
+            self.spawn(i, GAME_WIDTH // 2, PADDLE_TOP, PI, 400)
+
+    def spawn(self, game, x, y, angle, speed, uncounted=0):
+        # GameLevel.spawn_ball for one game, nothing is spawned past max_balls
+        if np.count_nonzero(self.alive[game]) + uncounted >= self.max_balls:
+            return
+        if self.ball_count[game] == self.speed.shape[1]:
+            self.grow()
+        slot = self.ball_count[game]
+        self.position[game, slot] = x, y
+        self.velocity[game, slot] = sin(angle) * speed, cos(angle) * speed
+        self.speed[game, slot] = speed
+        self.angle[game, slot] = angle
+        self.alive[game, slot] = True
+        self.ball_count[game] += 1
+
+    def grow(self):
+        capacity = 2 * self.speed.shape[1]
+        for name in ('position', 'velocity', 'speed', 'angle', 'alive'):
+            old = getattr(self, name)
+            new = np.zeros((self.count, capacity) + old.shape[2:], dtype=old.dtype)
+            new[:, :old.shape[1]] = old
+            setattr(self, name, new)
+
+    def step(self, actions):
+        '''actions is the paddle x of every game, as a controller's paddle_input returns it. Returns the
+        observations, the score gained in this step and which games ended, those start over right away.'''
+        score_before = self.score.copy()
+        stage_before = self.blocks_left > 0
+        # Player.update: center the paddle on the action and keep it between the walls
+        left = round_half_away(np.asarray(actions, dtype=np.float64)) - PADDLE_WIDTH // 2
+        self.paddle_left = np.clip(left, WALL, GAME_WIDTH - WALL - PADDLE_WIDTH)
+
+        # Balls spawned during the step only move from the next one
+        games, slots = np.nonzero(self.alive[:, :max(int(self.ball_count.max(initial=0)), 1)])
+        # Balls that can't reach a block this step don't affect each other, they all move in one pass
+        near = self.near_blocks(games, slots)
+        self.lost_early = np.zeros(self.alive.shape, dtype=bool)
+        self.move_balls(games[~near], slots[~near], blocks=False)
+        self.lost_early[games[~near], slots[~near]] = ~self.alive[games[~near], slots[~near]]
+        # The others move one after another within a game, as the sprite group updates them, so ball k
+        # of every game moves in the same pass
+        games, slots = games[near], slots[near]
+        for k in np.unique(slots).tolist():
+            self.move_balls(games[slots == k], slots[slots == k])
+
+        # One life per game: losing the last ball ends it. check_stage_completion gives no bonus then,
+        # the level is already paused for the lost life
+        lost = ~self.alive.any(axis=1)
+        cleared = stage_before & (self.blocks_left == 0) & ~lost
+        self.score[cleared] += 1000 * self.stages[cleared]
+        self.steps += 1
+        dones = cleared | lost | (self.steps >= self.max_steps)
+        rewards = self.score - score_before
+        self.compact()
+        if dones.any():
+            self.reset_games(dones)
+        return self.observe(), rewards, dones
+
+    def near_blocks(self, games, slots):
+        # Broad phase: whether a block is within reach of the ball this step, even after bounces.
+        # The fastest ball covers (MAX_SPEED + 10) * dt, find_hits looks a few pixels further
+        position = self.position[games, slots]
+        reach = BALL_SIZE / 2 + (MAX_SPEED + 10) * self.dt + 4
+        first_col = np.floor((position[:, 0] - reach - GRID_X) / CELL_WIDTH).astype(np.int64)
+        last_col = np.floor((position[:, 0] + reach - GRID_X) / CELL_WIDTH).astype(np.int64)
+        first_row = np.floor((position[:, 1] - reach - GRID_Y) / CELL_HEIGHT).astype(np.int64)
+        last_row = np.floor((position[:, 1] + reach - GRID_Y) / CELL_HEIGHT).astype(np.int64)
+        near = np.zeros(len(games), dtype=bool)
+        # The reach is shorter than a cell is wide and than two cells are high
+        for row_offset in range(3):
+            for col_offset in range(2):
+                row, col = first_row + row_offset, first_col + col_offset
+                inside = ((row <= last_row) & (col <= last_col) & (row >= 0) & (row < STAGE_ROWS)
+                          & (col >= 0) & (col < STAGE_COLS))
+                near |= inside & (self.blocks[games, np.where(inside, row, 0), np.where(inside, col, 0)] > 0)
+        return near
+
+    def move_balls(self, games, slots, blocks=True):
+        # collision.move_ball for ball slots[i] of game games[i], without looking for blocks when none are near
+        position = self.position[games, slots]
+        velocity = self.velocity[games, slots]
+        speed = self.speed[games, slots]
+        angle = self.angle[games, slots]
+        remaining = np.ones(len(games))
+        half = BALL_SIZE / 2
+        rows = np.arange(len(games))
+        for _ in range(MAX_BOUNCES):
+            # Multiplied in the same order as move_ball, so the results match it to the last bit
+            step = velocity[rows] * self.dt * remaining[rows][:, None]
+            box = np.concatenate((position[rows] - half, position[rows] + half), axis=1)
+            targets, present, cells = self.targets(games[rows], box, step, blocks)
+            time, side, hit = sweep(box, step[:, 0], step[:, 1], targets)
+            hit &= present
+            first = np.where(hit, time, np.inf).min(axis=1)
+            bounced = first < np.inf
+            # Balls that hit nothing move the rest of the way and are done
+            free = rows[~bounced]
+            position[free] += step[~bounced]
+            rows, step, first = rows[bounced], step[bounced], first[bounced]
+            if not len(rows):
+                break
+            hit, side, cells = hit[bounced], side[bounced], cells[bounced]
+            hit &= time[bounced] <= first[:, None] + 1e-9
+            position[rows] += step * first[:, None]
+            remaining[rows] *= 1 - first
+            self.resolve_hits(games, slots, rows, hit, side, cells, position, velocity, speed, angle)
+        # Balls still bouncing after MAX_BOUNCES stop where they are and carry on next step
+
+        self.position[games, slots] = position
+        self.velocity[games, slots] = velocity
+        self.speed[games, slots] = speed
+        self.angle[games, slots] = angle
+        # Ball.crash, by the rect the sprite would have
+        top = round_half_away(position[:, 1]) - BALL_SIZE // 2
+        self.alive[games, slots] = top <= GAME_HEIGHT + 20
+
+    def targets(self, games, box, step, blocks=True):
+        # Walls, the paddle while the ball comes down, and the blocks in the cells the whole move covers
+        m = len(games)
+        targets = np.zeros((m, WALL_TARGETS + 1 + (BLOCK_TARGETS if blocks else 0), 4))
+        targets[:, 0] = (GAME_WIDTH - WALL, -np.inf, np.inf, np.inf)
+        targets[:, 1] = (-np.inf, -np.inf, WALL, np.inf)
+        targets[:, 2] = (-np.inf, -np.inf, np.inf, 0)
+        paddle_left = self.paddle_left[games]
+        targets[:, PADDLE_TARGET] = np.stack((paddle_left, np.full(m, PADDLE_TOP), paddle_left + PADDLE_WIDTH,
+                                              np.full(m, PADDLE_TOP + PADDLE_HEIGHT)), axis=1)
+        present = np.ones(targets.shape[:2], dtype=bool)
+        present[:, PADDLE_TARGET] = step[:, 1] > 0
+        cells = np.zeros((m, BLOCK_TARGETS, 2), dtype=np.int64)
+        if not blocks:
+            return targets, present, cells
+
+        # The swept rect find_hits builds, and the cells BlockGrid.query visits for it
+        rect_left = np.trunc(np.minimum(box[:, 0], box[:, 0] + step[:, 0])).astype(np.int64) - 1
+        rect_top = np.trunc(np.minimum(box[:, 1], box[:, 1] + step[:, 1])).astype(np.int64) - 1
+        rect_right = rect_left + np.trunc(np.abs(step[:, 0]) + box[:, 2] - box[:, 0]).astype(np.int64) + 3
+        rect_bottom = rect_top + np.trunc(np.abs(step[:, 1]) + box[:, 3] - box[:, 1]).astype(np.int64) + 3
+        first_col = np.maximum((rect_left - GRID_X) // CELL_WIDTH, 0)
+        last_col = np.minimum((rect_right - 1 - GRID_X) // CELL_WIDTH, STAGE_COLS - 1)
+        first_row = np.maximum((rect_top - GRID_Y) // CELL_HEIGHT, 0)
+        last_row = np.minimum((rect_bottom - 1 - GRID_Y) // CELL_HEIGHT, STAGE_ROWS - 1)
+        # Moves are far shorter than a cell, so the cells covered are at most 2x2
+        for i, (row_offset, col_offset) in enumerate(((0, 0), (0, 1), (1, 0), (1, 1))):
+            row, col = first_row + row_offset, first_col + col_offset
+            inside = (row <= last_row) & (col <= last_col)
+            row, col = np.where(inside, row, 0), np.where(inside, col, 0)
+            cells[:, i] = np.stack((row, col), axis=1)
+            target = WALL_TARGETS + 1 + i
+            present[:, target] = inside & (self.blocks[games, row, col] > 0)
+            targets[:, target] = np.stack((GRID_X + col * CELL_WIDTH, GRID_Y + row * CELL_HEIGHT,
+                                           GRID_X + (col + 1) * CELL_WIDTH, GRID_Y + (row + 1) * CELL_HEIGHT), axis=1)
+        return targets, present, cells
+
+    def resolve_hits(self, games, slots, rows, hit, side, cells, position, velocity, speed, angle):
+        # Every hit in the order find_hits returns them, as move_ball applies them
+        for target in range(hit.shape[1]):
+            where = np.flatnonzero(hit[:, target])
+            if not len(where):
+                continue
+            balls, sides = rows[where], side[where, target]
+            if target < WALL_TARGETS:
+                # wall_bounce
+                velocity[balls[sides == LEFT], 0] = -np.abs(velocity[balls[sides == LEFT], 0])
+                velocity[balls[sides == RIGHT], 0] = np.abs(velocity[balls[sides == RIGHT], 0])
+                vertical = balls[(sides == TOP) | (sides == BOTTOM)]
+                velocity[vertical, 1] = np.abs(velocity[vertical, 1])
+            elif target == PADDLE_TARGET:
+                # paddle_bounce: the further from the paddle's center, the flatter the angle
+                paddle_x = self.paddle_left[games[balls]] + PADDLE_WIDTH // 2
+                angle[balls] = PI + 0.8 * PI * (paddle_x - position[balls, 0]) / PADDLE_WIDTH
+                speed[balls] += np.where(speed[balls] <= MAX_SPEED, 10, 0)
+                velocity[balls] = np.stack((np.sin(angle[balls]), np.cos(angle[balls])), axis=1) * speed[balls, None]
+            else:
+                self.hit_blocks(games, slots, balls, sides, cells[where, target - WALL_TARGETS - 1], position, velocity,
+                                speed, angle)
+
+    def hit_blocks(self, games, slots, balls, sides, cells, position, velocity, speed, angle):
+        # Block.get_hit and its subclasses for one block per ball
+        game = games[balls]
+        row, col = cells[:, 0], cells[:, 1]
+        kind = self.kind_of[self.blocks[game, row, col]]
+
+        # Speed changes set the velocity from the ball's angle before the bounce
+        faster, slower = balls[kind == SPEED_UP], balls[kind == SLOW_DOWN]
+        speed[faster] = MAX_SPEED
+        speed[slower] = np.where(speed[slower] * 0.5 > MIN_SPEED, speed[slower] * 0.5, MIN_SPEED)
+        changed = np.concatenate((faster, slower))
+        velocity[changed] = np.stack((np.sin(angle[changed]), np.cos(angle[changed])), axis=1) * speed[changed, None]
+
+        # A bottom shield only bounces balls off its bottom, any other side breaks it like a plain block
+        shielded = (kind == BOTTOM_SHIELD) & (sides == BOTTOM)
+        broken = ~shielded
+        self.score[game[broken]] += np.where(kind[broken] == BOTTOM_SHIELD, 15, 8)
+        self.blocks[game[broken], row[broken], col[broken]] = 0
+        self.blocks_left[game[broken]] -= 1
+        velocity[balls[sides == BOTTOM], 1] = np.abs(velocity[balls[sides == BOTTOM], 1])
+        velocity[balls[sides == TOP], 1] = -np.abs(velocity[balls[sides == TOP], 1])
+        velocity[balls[sides == LEFT], 0] = -np.abs(velocity[balls[sides == LEFT], 0])
+        velocity[balls[sides == RIGHT], 0] = np.abs(velocity[balls[sides == RIGHT], 0])
+
+        # Ice blocks release another ball from their center in a random direction, rare enough for a loop
+        for i in np.flatnonzero(kind == ICE).tolist():
+            g = int(game[i])
+            new_angle = self.rngs[g].uniform(0, 2*PI)
+            # Balls after this one that were lost in the early pass are still in the sprite group at this point
+            slot = int(slots[balls[i]])
+            self.spawn(g, GRID_X + col[i] * CELL_WIDTH + CELL_WIDTH // 2, GRID_Y + row[i] * CELL_HEIGHT + CELL_HEIGHT // 2,
+                       new_angle, speed[balls[i]], np.count_nonzero(self.lost_early[g, slot + 1:]))
+
+    def compact(self):
+        # Drop lost balls, keeping the others in spawn order
+        if np.count_nonzero(self.alive) == self.ball_count.sum():
+            return
+        order = np.argsort(~self.alive, axis=1, kind='stable')
+        for name in ('position', 'velocity', 'speed', 'angle', 'alive'):
+            array = getattr(self, name)
+            index = order if array.ndim == 2 else order[..., None]
+            setattr(self, name, np.take_along_axis(array, index, axis=1))
+        self.ball_count = np.count_nonzero(self.alive, axis=1)
+
+    def observe(self):
+        # Copies, so they stay valid after the next step. balls holds (x, y, velocity x, velocity y) of
+        # every ball in spawn order, padded with zeros up to the most balls any game has
+        width = max(int(self.ball_count.max(initial=0)), 1)
+        balls = np.concatenate((self.position[:, :width], self.velocity[:, :width]), axis=2)
+        balls[~self.alive[:, :width]] = 0
+        return {'paddle_x': self.paddle_left + PADDLE_WIDTH // 2, 'balls': balls,
+                'ball_count': self.ball_count.copy(), 'blocks': self.blocks.copy(), 'score': self.score.copy()}
@@ -1,97 +1,294 @@
-import time, pygame
+from time import perf_counter
+# Taken before the other imports, so the startup report includes them
+STARTED = perf_counter()
+
+import argparse, getpass, os, random, threading, pygame
 from pathlib import PurePath
 
+from engine.asset_cache import AssetCache
+from engine.asset_bundle import load_bundle
+from engine.audio import AudioManager
+from engine.output import OutputStage
+from engine.frame_pacer import FramePacer
+from engine.scheduler import Scheduler
+from engine.controllers import MouseController
+from engine.text_cache import TextCache
+from engine.profiler import Profiler, ProfilerOverlay
+from engine.recording import InputRecorder
+from engine.score_store import ScoreStore
+from engine.settings import Settings
+from engine.sim_thread import SimulationThread
+from engine.governor import QualityGovernor
 from states.main_menu import MainMenu
 
+# Keyboard keys that map to Game.keys
+KEY_BINDINGS = {pygame.K_UP: 'up', pygame.K_DOWN: 'down', pygame.K_LEFT: 'left', pygame.K_RIGHT: 'right',
+                pygame.K_SPACE: 'space', pygame.K_RETURN: 'enter', pygame.K_ESCAPE: 'escape'}
+
 class Game():
-    def __init__(self):
+    def __init__(self, headless=False, seed=None, record=None, replay=False):
         '''Initialize the game'''
-        pygame.init()
-        # Make mouse cursor invisible and lock it in screen boundaries
-        pygame.mouse.set_cursor((8,8),(0,0),(0,0,0,0,0,0,0,0),(0,0,0,0,0,0,0,0))
+        # Headless runs use SDL's dummy video and audio drivers, no window or sound device is needed
+        self.headless = headless
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+            # Let SIGTERM end the process, e.g. when a multiprocessing pool shuts down
+            os.environ['SDL_NO_SIGNAL_HANDLERS'] = '1'
+        # Startup milestones in seconds since the process started
+        self.startup = {}
+        # Performance settings from the options screen, headless runs always use the defaults
+        self.settings = Settings(None if headless else 'settings.json')
+        # Only the modules the game uses, pygame.init() would also start joystick, camera etc.
+        pygame.display.init()
+        pygame.font.init()
+        # Sets up the mixer buffer and channels before starting it
+        self.audio = AudioManager(buffer=self.settings['audio_buffer'], channels=self.settings['audio_channels'])
+        self.audio.start()
+        if not headless:
+            # Make mouse cursor invisible and lock it in screen boundaries
+            pygame.mouse.set_cursor((8,8),(0,0),(0,0,0,0,0,0,0,0),(0,0,0,0,0,0,0,0))
+            pygame.event.set_grab(True)
+        # Timing scopes for the F3 overlay, they cost next to nothing while it is off
+        self.profiler = Profiler()
+        self.profiler.enabled = self.settings['fps_overlay']
         # Set up display
         self.GAME_WIDTH, self.GAME_HEIGHT = 1280, 960
-        self.SCREEN_WIDTH, self.SCREEN_HEIGHT = 1280, 960
-        self.game_canvas = pygame.Surface((self.GAME_WIDTH, self.GAME_HEIGHT))
-        self.screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
+        # The window size, the game itself always runs at GAME_WIDTH x GAME_HEIGHT
+        self.SCREEN_WIDTH, self.SCREEN_HEIGHT = (1280, 960) if headless else self.settings['resolution']
+        # The output stage draws straight to the window when both sizes match, otherwise it scales and letterboxes
+        self.output = OutputStage((self.GAME_WIDTH, self.GAME_HEIGHT), (self.SCREEN_WIDTH, self.SCREEN_HEIGHT),
+                                  scale_mode=self.settings['scale_mode'], flags=pygame.RESIZABLE,
+                                  vsync=self.settings['vsync'], profiler=self.profiler)
+        self.screen = self.output.screen
+        self.game_canvas = self.output.canvas
         # Set up game values
         self.running, self.playing = True, True
         self.keys = {'up': False, 'down': False, 'left': False, 'right': False, 'space': False, 'enter':False, 'escape': False}
+        # Mouse snapshot in game coordinates, taken once per frame together with the keys
+        self.mouse_pos = (self.GAME_WIDTH // 2, self.GAME_HEIGHT // 2)
+        self.mouse_pressed = False
+        # Every level draws its own seed from here, so one seed reproduces a whole session
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        self.rng = random.Random(self.seed)
+        # High scores are saved under the login name, headless runs don't keep any
+        self.player_name = getpass.getuser().upper()
+        self.scores = None if headless else ScoreStore('scores.db')
         # Set up time values to make the game speed time dependent, not FPS dependent
-        self.dt, self.prev_time = 0, 0
+        self.dt = 0
+        # Frame rate cap, dropped to a low tick rate while the active state is idle
+        self.pacer = FramePacer(fps_cap=0 if headless else self.settings['fps_cap'], idle_fps=0 if headless else 30)
+        # Moves the paddle, can be swapped for a bot
+        self.controller = MouseController(self)
+        # The simulation always advances in fixed steps, frame time is collected in the accumulator
+        self.fixed_dt = 1/240
+        self.max_substeps = 8
+        self.accumulator = 0
+        # Timed callbacks and tweens, advanced together with the simulation
+        self.scheduler = Scheduler()
+        # Optionally the level is stepped on its own thread at the fixed rate and the main thread only renders,
+        # so a slow frame doesn't hold back the simulation or the input. Recorded and replayed sessions stay
+        # single threaded, the thread steps on the wall clock instead of the recorded frame times
+        self.replay = replay
+        self.threaded = self.settings['sim_thread'] and not record and not replay
+        self.simulation = None
+        # Ball physics engine: 'sprite' updates each Ball sprite, 'numpy' updates all balls in one vectorized pass
+        self.ball_mode = 'sprite'
+        # Balls beyond this many are not spawned
+        self.max_balls = self.settings['max_balls']
+        # Frame times and input changes written to a file, to replay the session later
+        self.recorder = InputRecorder(record, self.seed, self.max_balls) if record else None
+        # Render path: 'full' redraws and flips the whole canvas every frame, 'dirty' only pushes the changed rects
+        self.render_mode = 'dirty'
+        self.rendered_state = None
+        # Particles and other effects that don't change the game, dropped by the governor under load
+        self.visual_extras = True
+        # The governor's last step only renders every render_interval-th frame, the simulation and input keep
+        # their full rate. skipped_time is the frame time since the last rendered frame
+        self.render_interval = 1
+        self.frame_count = 0
+        self.skipped_time = 0
+        # Trades quality for frame time when frames overrun the budget. Off for headless, recorded and replayed
+        # runs, where it would make the simulation depend on how fast the machine is
+        self.governor = QualityGovernor(self)
+        self.governor.configure(self.settings['auto_quality'] and not headless and not record and not replay)
         # Set up game stack to contain different game states
         self.state_stack = []
         # 
         self.load_assets()
+        self.profiler_overlay = ProfilerOverlay(self)
         self.load_states()
 
     def game_loop(self):
+        self.pacer.reset()
         while self.playing:
             self.get_dt()
-            self.get_events()
+            with self.profiler.scope('events'):
+                deltas = self.get_events()
+            if self.simulation is not None:
+                self.simulation.push_input(deltas)
+            else:
+                self.apply_input(deltas)
+            if self.recorder:
+                self.recorder.record_frame(self.dt, deltas)
+            self.governor.start_frame()
             self.update()
+            self.frame_count += 1
+            if self.frame_count % self.render_interval == 0:
+                self.render()
+                self.skipped_time = 0
+            else:
+                self.skipped_time += self.dt
+            self.governor.end_frame(self.output.flip_time if self.output.vsync else 0)
+            self.profiler.end_frame()
+
+    def step(self, render=False):
+        # Advance exactly one fixed simulation step, unthrottled, for headless runs
+        self.dt = self.fixed_dt
+        self.update()
+        if render:
             self.render()
-            # print(1/self.dt) # FPS count for performance testing
 
     def get_events(self):
-        # Lock the mouse inside game boundaries
-        pygame.event.set_grab(True)
-        
+        # Returns this frame's input changes as (name, value), applied to the snapshot by apply_input
+        deltas = []
         for event in pygame.event.get():
             # Check if the user wants to quit
             if event.type == pygame.QUIT:
                 self.playing = False
                 self.running = False
+            # Window resized, keep the game centered with black bars
+            if event.type == pygame.VIDEORESIZE:
+                self.resize_window()
             # Key down
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP:
-                    self.keys['up'] = True
-                if event.key == pygame.K_DOWN:
-                    self.keys['down'] = True
-                if event.key == pygame.K_LEFT:
-                    self.keys['left'] = True
-                if event.key == pygame.K_RIGHT:
-                    self.keys['right'] = True
-                if event.key == pygame.K_RETURN:
-                    self.keys['enter'] = True
-                if event.key == pygame.K_ESCAPE:
-                    self.keys['escape'] = True
-            
+                if event.key in KEY_BINDINGS:
+                    deltas.append((KEY_BINDINGS[event.key], True))
+                # Profiler overlay on and off, and writing out what it recorded
+                if event.key == pygame.K_F3:
+                    self.profiler.toggle()
+                if event.key == pygame.K_F4:
+                    self.profiler.export_csv('profile.csv')
+                    self.profiler.export_chrome_trace('profile_trace.json')
+
             if event.type == pygame.KEYUP:
-                if event.key == pygame.K_UP:
-                    self.keys['up'] = False
-                if event.key == pygame.K_DOWN:
-                    self.keys['down'] = False
-                if event.key == pygame.K_LEFT:
-                    self.keys['left'] = False
-                if event.key == pygame.K_RIGHT:
-                    self.keys['right'] = False
-                if event.key == pygame.K_RETURN:
-                    self.keys['enter'] = False
-                if event.key == pygame.K_ESCAPE:
-                    self.keys['escape'] = False
-    
+                if event.key in KEY_BINDINGS:
+                    deltas.append((KEY_BINDINGS[event.key], False))
+
+        # The mouse is read once per frame instead of by every paddle update
+        x, y = self.output.to_game(pygame.mouse.get_pos())
+        mouse_pos = (int(x), int(y))
+        if mouse_pos != self.mouse_pos:
+            deltas.append(('mouse', mouse_pos))
+        mouse_pressed = bool(pygame.mouse.get_pressed()[0])
+        if mouse_pressed != self.mouse_pressed:
+            deltas.append(('button', mouse_pressed))
+        return deltas
+
+    def apply_input(self, deltas):
+        for name, value in deltas:
+            if name == 'mouse':
+                self.mouse_pos = value
+            elif name == 'button':
+                self.mouse_pressed = value
+            elif name == 'max_balls':
+                # Only comes from a recording, where the ball limit changed on the options screen
+                self.max_balls = value
+            else:
+                self.keys[name] = value
 
     def update(self):
-        self.state_stack[-1].update(self.dt, self.keys)
+        if self.simulation is not None:
+            # The simulation thread steps the state by itself
+            if self.simulation.is_alive():
+                return
+            # It stopped because the state left the stack, the main thread takes over again
+            self.simulation.drain_inputs()
+            self.simulation = None
+        state = self.state_stack[-1]
+        if self.threaded and state.threadable:
+            self.simulation = SimulationThread(self, state)
+            self.accumulator = 0
+            return
+
+        self.accumulator += self.dt
+        steps = 0
+        while self.accumulator >= self.fixed_dt and steps < self.max_substeps:
+            self.scheduler.update(self.fixed_dt)
+            state = self.state_stack[-1]
+            with self.profiler.scope(state.update_scope):
+                state.update(self.fixed_dt, self.keys)
+            self.accumulator -= self.fixed_dt
+            steps += 1
+        # After a long hitch drop the time that could not be simulated instead of trying to catch up
+        if steps == self.max_substeps:
+            self.accumulator = min(self.accumulator, self.fixed_dt)
+        # Sounds requested by all the substeps start together
+        self.audio.flush()
     
     def render(self):
-        self.state_stack[-1].render(self.game_canvas)
-        self.screen.blit(pygame.transform.scale(self.game_canvas, (self.SCREEN_WIDTH, self.SCREEN_HEIGHT)), (0, 0))
-        pygame.display.flip()
+        state = self.state_stack[-1]
+        # A different state drew on the canvas last, so this one has to draw everything again
+        if state is not self.rendered_state:
+            state.invalidate()
+            self.rendered_state = state
+        # Put back what the profiler overlay covered, so the state finds the canvas as it left it
+        overlay_rects = [self.profiler_overlay.restore(self.game_canvas)]
+        with self.profiler.scope('render'):
+            dirty_rects = state.render(self.game_canvas)
+        if len(self.startup) < 4:
+            self.mark_startup('first frame')
+            if state.playable:
+                self.mark_startup('first playable frame')
+        if self.profiler.enabled:
+            overlay_rects.append(self.profiler_overlay.draw(self.game_canvas, state))
+        if self.render_mode == 'full':
+            dirty_rects = None
+        elif dirty_rects is not None:
+            dirty_rects += [rect for rect in overlay_rects if rect is not None]
+        self.output.present(dirty_rects)
+
+    def apply_settings(self):
+        # Applies changed settings right away, only the audio buffer waits for the next start
+        settings = self.settings
+        if not self.headless:
+            if settings['resolution'] != self.screen.get_size() or settings['vsync'] != self.output.vsync:
+                self.output.set_window(settings['resolution'], settings['vsync'])
+                self.resize_window()
+            if settings['scale_mode'] != self.output.scale_mode:
+                self.output.scale_mode = settings['scale_mode']
+                self.resize_window()
+            self.pacer.fps_cap = settings['fps_cap']
+        self.audio.set_channels(settings['audio_channels'])
+        # Ball limit and the rest, as far as the governor currently allows
+        max_balls = self.max_balls
+        self.governor.configure(settings['auto_quality'] and not self.headless and not self.recorder
+                                and not self.replay)
+        # The ball limit changes the simulation, a replay has to change it at the same point
+        if self.recorder and self.max_balls != max_balls:
+            self.recorder.record_ball_limit(self.max_balls)
+        # Takes effect from the next level on
+        self.threaded = settings['sim_thread'] and not self.recorder and not self.replay
+        if self.profiler.enabled != settings['fps_overlay']:
+            self.profiler.toggle()
+
+    def resize_window(self):
+        self.game_canvas = self.output.resize()
+        self.screen = self.output.screen
+        self.SCREEN_WIDTH, self.SCREEN_HEIGHT = self.screen.get_size()
+        # The whole window has to be presented again
+        self.rendered_state = None
     
 
     def get_dt(self):
-        now = time.time()
-        self.dt = now - self.prev_time
-        self.prev_time = now
+        self.dt = self.pacer.tick(self.state_stack[-1].idle)
     
 
     def draw_text(self, surface, font, text, color, x, y):
-        text_surface = font.render(text, True, color)
+        text_surface = self.text_cache.render(font, text, color)
         text_rect = text_surface.get_rect()
         text_rect.center = (x, y)
-        surface.blit(text_surface, text_rect)
+        return surface.blit(text_surface, text_rect)
     
     def load_assets(self):
         # Create pointers to directiries
@@ -99,13 +296,41 @@ class Game():
         self.sprites_dir = PurePath(self.assets_dir, 'sprites')
         self.font_dir = PurePath(self.assets_dir, 'fonts')
         self.sounds_dir = PurePath(self.assets_dir, 'sounds')
+        # Shared cache so every sprite and sound is loaded from disk only once, from the bundle when there is one
+        # (build it with: python -m engine.asset_bundle)
+        self.assets = AssetCache(load_bundle('assets.pkbundle'))
+        # Rendered text surfaces, so static labels are not rasterized again every frame
+        self.text_cache = TextCache()
     
     def load_font(self, name, size):
-        return pygame.font.Font(PurePath(self.font_dir, name), size)
+        return self.assets.font(PurePath(self.font_dir, name), size)
+
+    def load_image(self, *path):
+        return self.assets.image(PurePath(self.sprites_dir, *path))
+
+    def load_sound(self, name):
+        return self.assets.sound(PurePath(self.sounds_dir, name))
     
     def load_states(self):
         self.main_menu = MainMenu(self)
         self.state_stack.append(self.main_menu)
+        # Load the level's resources while the menu is on screen, so starting a game doesn't stall.
+        # Its font is loaded here, fonts have to stay on the main thread with the rest of the text rendering
+        if not self.headless:
+            self.load_font('PilotCommand-3zn93.ttf', 60)
+            threading.Thread(target=self.warm_up, daemon=True).start()
+
+    def warm_up(self):
+        from states.level import preload
+        preload(self)
+        self.mark_startup('warm-up done')
+
+    def mark_startup(self, milestone):
+        # Only the first time counts
+        self.startup.setdefault(milestone, perf_counter() - STARTED)
+
+    def startup_report(self):
+        return 'Startup: ' + ', '.join(f'{milestone} {time:.2f} s' for milestone, time in self.startup.items())
     
 
     def reset_keys(self):
@@ -114,6 +339,23 @@ class Game():
 
 
 if __name__ == '__main__':
-    game = Game()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, help='seed for every random choice in the session')
+    parser.add_argument('--record', help='write the session to this file, play it back with tools/replay.py')
+    args = parser.parse_args()
+
+    game = Game(seed=args.seed, record=args.record)
     while game.running:
-        game.game_loop()
\ No newline at end of file
+        game.game_loop()
+    if game.simulation:
+        game.simulation.stop()
+    if game.recorder:
+        game.recorder.close()
+    if game.scores:
+        game.scores.close()
+    print(game.startup_report())
+    print(game.pacer.report())
+    print(game.assets.report())
+    print(game.text_cache.report())
+    print(game.audio.report())
+    print(game.governor.report())
\ No newline at end of file
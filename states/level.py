@@ -1,47 +1,94 @@
 import pygame
+import numpy as np
 from pathlib import PurePath
 from math import cos, sin
 from math import pi as PI
-from csv import reader
-from time import sleep
 import random
+from collections import deque
+from time import perf_counter
 
 from states.state import State
+from engine.audio import BLOCK_HIT, STAGE_CLEAR, LIFE_LOST
+from engine.stage_pack import BLOCK_CODES, STAGE_COLS, STAGE_ROWS, load_stage_pack
+from engine.spatial_grid import BlockGrid
+from engine.stage_stream import StagePrefetcher, endless_stages, pack_stages
+from engine.ball_engine import BallEngine
+from engine.particles import ParticleSystem
+from engine.sim_thread import Snapshot
+from engine.collision import move_ball
 
 
 vector = pygame.math.Vector2
 # from states.main_menu import MainMenu
 
 class GameLevel(State):
-    def __init__(self, game):
+    def __init__(self, game, stage_set=PurePath('stages', 'test_set1.csv'), stage=2, seed=None, endless=False):
         State.__init__(self, game)
 
         self.game = game
+        self.playable = True
+        self.threadable = True
+        # Every random choice in the level comes from here, so a seed replays the level exactly
+        self.seed = seed if seed is not None else game.rng.getrandbits(32)
+        self.rng = random.Random(self.seed)
         
-        self.stage = 2
+        self.stage = stage
         self.lives = 2
         self.score = 0
+        self.balls_lost = 0
+        # Timed pause after losing a life or clearing a stage, the game keeps rendering meanwhile
         self.is_paused = False
+        self.pause_timer = None
+        self.pause_message = ''
 
         # Define sprite groups
         self.player_group = pygame.sprite.Group()
         self.ball_group = pygame.sprite.Group()
         self.block_group = pygame.sprite.Group()
+        # Spatial index of the blocks, laid out on the same lattice as create_block_grid
+        self.block_grid = BlockGrid(40, 80, 60, 30, STAGE_COLS, STAGE_ROWS)
+
+        # Compiled stage set, stages are read straight from their offset in the pack. Endless mode goes through
+        # every stage set, with a generated stage after each one, for as long as the player lasts
+        self.endless = endless
+        if endless:
+            self.stage_set = 'endless'
+            self.stage_packs = [load_stage_pack(path) for path in ENDLESS_STAGE_SETS]
+            self.endless_seed = self.rng.getrandbits(32)
+        else:
+            self.stage_set = PurePath(stage_set).stem
+            self.stage_pack = load_stage_pack(stage_set)
+        # The next stages are built on a worker thread while this one is played
+        self.stage_stream = StagePrefetcher(self.stage_source(stage), self.build_blocks)
+
+        # Balls are either separate sprites or rows in the vectorized ball engine
+        self.ball_engine = None
+        if self.game.ball_mode == 'numpy':
+            self.ball_engine = BallEngine(self.game, self, self.game.load_image('ball', 'ball.png'))
+
+        # Block debris and ball trails, one pool with a fixed budget for the whole level
+        self.particles = ParticleSystem(seed=self.seed)
+        self.debris_colors = {}
+        # Debris of blocks destroyed on the simulation thread, added to the particles by the render thread
+        self.debris_queue = deque()
+        # Bumped whenever blocks are placed or destroyed, snapshots only copy the blocks after a change
+        self.blocks_version = 0
+        self.snapshot_blocks = (None, ())
 
         # Initialize player, ball and blocks objects
         self.player = Player(self.game, self)
-        self.ball = Ball(self.game, self, self.player.rect.centerx, self.player.rect.top, PI, 400)
-        self.create_block_grid(self.stage)
+        self.ball = self.spawn_ball(self.player.rect.centerx, self.player.rect.top, PI, 400)
+        self.load_stage(self.stage)
 
         # Load sounds
-        self.bounce_sound = pygame.mixer.Sound(PurePath(self.game.sounds_dir, 'bounce.wav'))
-        self.hit_block_sound = pygame.mixer.Sound(PurePath(self.game.sounds_dir, 'hit_block.wav'))
-        self.hit_wall_sound = pygame.mixer.Sound(PurePath(self.game.sounds_dir, 'hit_wall.wav'))
-        self.lose_live_sound = pygame.mixer.Sound(PurePath(self.game.sounds_dir, 'lose_live.wav'))
-        self.next_stage_sound = pygame.mixer.Sound(PurePath(self.game.sounds_dir, 'next_stage.wav'))
+        self.bounce_sound = self.game.load_sound('bounce.wav')
+        self.hit_block_sound = self.game.load_sound('hit_block.wav')
+        self.hit_wall_sound = self.game.load_sound('hit_wall.wav')
+        self.lose_live_sound = self.game.load_sound('lose_live.wav')
+        self.next_stage_sound = self.game.load_sound('next_stage.wav')
 
         # Load HUD images
-        self.sidebar = pygame.image.load(PurePath(self.game.sprites_dir, 'other', 'sidebar.png'))
+        self.sidebar = self.game.load_image('other', 'sidebar.png')
 
         self.sidebar_l_rect = self.sidebar.get_rect()
         self.sidebar_l_rect.topleft = (0, 0)
@@ -49,104 +96,336 @@ class GameLevel(State):
         self.sidebar_r_rect = self.sidebar.get_rect()
         self.sidebar_r_rect.topright = (self.game.GAME_WIDTH, 0)
 
-        self.live_indicator = pygame.image.load(PurePath(self.game.sprites_dir, 'other', 'live_indicator.png'))
+        self.live_indicator = self.game.load_image('other', 'live_indicator.png')
 
         self.hud_font = self.game.load_font('PilotCommand-3zn93.ttf', 60)
-        
 
-    def update(self, delta_time, keys):
-        # test spawning multiple balls
-        if keys['up']:
+        # Dirty rectangle rendering: static blocks and sidebars are composed once into the background
+        self.background = None
+        self.play_area = pygame.Rect(40, 0, self.game.GAME_WIDTH-80, self.game.GAME_HEIGHT)
+        self.drawn_rects = []
+        self.erased_rects = []
+        # Blocks in the background when rendering from snapshots, as (blocks version, set of blocks)
+        self.rendered_blocks = (None, set())
+        self.ball_image = self.game.load_image('ball', 'ball.png')
+
 
+    def update(self, delta_time, keys):
+        # test spawning multiple balls, not during a pause, reset() adds the next ball after a lost life
+        if keys['up'] and not self.is_paused:
             self.spawn_ball(self.player.rect.centerx, self.player.rect.top, PI, 400)
         if keys['escape']:
             self.exit_state()
+            self.game.reset_keys()
+            return
         self.player.update(delta_time, keys)
-        self.ball_group.update(delta_time, keys)
+        if self.is_paused:
+            # Enter or space skips the rest of the pause
+            if keys['enter'] or keys['space']:
+                self.pause_timer.finish()
+            self.game.reset_keys()
+            return
+        with self.game.profiler.scope('physics'):
+            if self.ball_engine is not None:
+                self.ball_engine.update(delta_time)
+            else:
+                self.ball_group.update(delta_time, keys)
         self.game.reset_keys()
+        # The last ball was lost without lives left, game_over already took the level off the stack
+        if self.game.state_stack[-1] is not self:
+            return
         self.check_stage_completion()
-        print(1/delta_time)
 
     def render(self, surface):
+        if self.snapshots is not None:
+            return self.render_snapshot(surface)
+        if self.game.render_mode == 'dirty':
+            return self.render_dirty(surface)
         surface.fill((0, 0, 0))
         self.player_group.draw(surface)
-        self.ball_group.draw(surface)
+        if self.ball_engine is not None:
+            self.ball_engine.draw(surface)
+        else:
+            self.ball_group.draw(surface)
         self.block_group.draw(surface)
-        self.display_hud(surface)
+        self.draw_particles(surface)
+        with self.game.profiler.scope('hud'):
+            self.display_hud(surface)
+
+    def render_dirty(self, surface):
+        if self.full_redraw or self.background is None:
+            self.compose_background()
+            surface.blit(self.background, (0, 0))
+            dirty_rects = [surface.get_rect()]
+            self.erased_rects = []
+            self.full_redraw = False
+        else:
+            # Restore the background under everything drawn last frame and under destroyed blocks
+            dirty_rects = self.drawn_rects + self.erased_rects
+            for rect in dirty_rects:
+                surface.blit(self.background, rect, rect)
+            self.erased_rects = []
+
+        # Moving sprites stay under the sidebars, as in the full redraw
+        surface.set_clip(self.play_area)
+        self.drawn_rects = self.draw_particles(surface)
+        self.drawn_rects.append(surface.blit(self.player.image, self.player.rect))
+        if self.ball_engine is not None:
+            self.drawn_rects += self.ball_engine.draw(surface)
+        else:
+            self.drawn_rects += [surface.blit(ball.image, ball.rect) for ball in self.ball_group]
+        surface.set_clip(None)
+        with self.game.profiler.scope('hud'):
+            self.drawn_rects += self.display_status(surface)
+        return dirty_rects + self.drawn_rects
+
+    def render_snapshot(self, surface):
+        # The level as the simulation thread last published it, blended between its last two steps
+        previous, latest, blend = self.snapshots.interpolation(perf_counter())
+        if self.full_redraw or self.background is None:
+            self.compose_background(latest.blocks)
+            surface.blit(self.background, (0, 0))
+            dirty_rects = [surface.get_rect()]
+            self.rendered_blocks = (latest.blocks_version, set(latest.blocks))
+            self.full_redraw = False
+        else:
+            self.update_background(latest)
+            dirty_rects = self.drawn_rects + self.erased_rects
+            for rect in dirty_rects:
+                surface.blit(self.background, rect, rect)
+        self.erased_rects = []
+
+        player_rect = self.player.rect.copy()
+        player_rect.x = round(previous.player_x + (latest.player_x - previous.player_x) * blend)
+        balls = latest.balls
+        # Balls are only blended while the same ones are alive, a spawned or lost ball shows the latest step
+        if len(previous.balls) == len(balls):
+            balls = previous.balls + (balls - previous.balls) * blend
+
+        surface.set_clip(self.play_area)
+        while self.debris_queue:
+            self.particles.debris(*self.debris_queue.popleft())
+        self.drawn_rects = self.draw_particles(surface, balls if latest.trails else balls[:0])
+        self.drawn_rects.append(surface.blit(self.player.image, player_rect))
+        ball_rect = self.ball_image.get_rect()
+        for center in balls.tolist():
+            ball_rect.center = center
+            self.drawn_rects.append(surface.blit(self.ball_image, ball_rect))
+        surface.set_clip(None)
+        with self.game.profiler.scope('hud'):
+            self.drawn_rects += self.display_status(surface, latest)
+        return dirty_rects + self.drawn_rects
+
+    def update_background(self, snapshot):
+        # Patch blocks destroyed or placed since the last rendered snapshot into the background
+        version, blocks = self.rendered_blocks
+        if version == snapshot.blocks_version:
+            return
+        current = set(snapshot.blocks)
+        for block in blocks - current:
+            self.background.fill((0, 0, 0), block.rect)
+            self.erased_rects.append(block.rect.copy())
+        for block in current - blocks:
+            self.erased_rects.append(self.background.blit(block.image, block.rect))
+        self.rendered_blocks = (snapshot.blocks_version, current)
+
+    def snapshot(self, time):
+        # Runs on the simulation thread after every step, the block tuple is only rebuilt after a change
+        if self.snapshot_blocks[0] != self.blocks_version:
+            self.snapshot_blocks = (self.blocks_version, tuple(self.block_group))
+        balls = self.ball_positions().copy()
+        balls.flags.writeable = False
+        return Snapshot(time, self.player.rect.x, balls, self.snapshot_blocks[1], self.blocks_version, self.score,
+                        self.lives, self.pause_message, not self.is_paused and not self.player.is_magnetic)
+
+    def draw_particles(self, surface, trails=None):
+        # Particles are cosmetic, so they advance once per rendered frame instead of every simulation step.
+        # trails are the ball centers to leave a trail behind, by default the live balls while they move
+        with self.game.profiler.scope('particles'):
+            # The quality governor turns particles off under load, the ones alive fade out as usual
+            self.particles.budget = self.particles.capacity if self.game.visual_extras else 0
+            if trails is None and not self.is_paused and not self.player.is_magnetic:
+                trails = self.ball_positions()
+            if trails is not None:
+                self.particles.trail(trails - 3)
+            # Frames the governor didn't render count as well
+            self.particles.update(min(self.game.dt + self.game.skipped_time, 0.1))
+            return self.particles.draw(surface)
+
+    def compose_background(self, blocks=None):
+        if self.background is None:
+            self.background = pygame.Surface((self.game.GAME_WIDTH, self.game.GAME_HEIGHT)).convert()
+        self.background.fill((0, 0, 0))
+        if blocks is None:
+            self.block_group.draw(self.background)
+        else:
+            self.background.blits([(block.image, block.rect) for block in blocks], doreturn=False)
+        self.display_sidebars(self.background)
+
+    def add_debris(self, rect, color):
+        # The particles belong to the render thread while a simulation thread steps the level
+        if self.snapshots is not None:
+            self.debris_queue.append((rect.copy(), color))
+        else:
+            self.particles.debris(rect, color)
+
+    def erase_block(self, rect):
+        # Patch a destroyed block out of the background instead of recomposing it. With a simulation thread
+        # the background belongs to the render thread, which finds destroyed blocks in the snapshots
+        self.blocks_version += 1
+        if self.background is not None and self.snapshots is None:
+            self.background.fill((0, 0, 0), rect)
+            self.erased_rects.append(rect.copy())
     
+    def stage_source(self, first):
+        # (stage number, layout) of every stage from first on
+        if self.endless:
+            return endless_stages(self.stage_packs, random.Random(self.endless_seed), first)
+        return pack_stages(self.stage_pack, first)
+
     def create_block_grid(self, stage):
-        # Load stage set CSV file
-        with open(PurePath('stages', 'test_set1.csv')) as file:
-            csv_reader = reader(file, delimiter=";")
-            stage_layouts = list(csv_reader)
-            start_row = stage + (stage-1)*20
-            end_row = start_row + 20
-            stage_layout = stage_layouts[start_row:end_row]
-        # Create blocks grid
-        for i in range(len(stage_layout)):
-            for j in range(len(stage_layout[i])):
-                if 'STD' in stage_layout[i][j]:
-                    Block(self.game, self, stage_layout[i][j], 40+j*60, 80+i*30)
-                if 'SPD' in stage_layout[i][j]:
-                    SpeedUpBlock(self.game, self, stage_layout[i][j], 40+j*60, 80+i*30)
-                if 'SLD' in stage_layout[i][j]:
-                    SlowDownBlock(self.game, self, stage_layout[i][j], 40+j*60, 80+i*30)
-                if 'ICE' in stage_layout[i][j]:
-                    IceBlock(self.game, self, stage_layout[i][j], 40+j*60, 80+i*30)
-                if 'BSHI' in stage_layout[i][j]:
-                    BottomShieldBlock(self.game, self, stage_layout[i][j], 40+j*60, 80+i*30)
+        # Builds the stage here, from the same source the prefetcher uses
+        _, layout = next(self.stage_source(stage))
+        self.place_blocks(self.build_blocks(layout))
+
+    def load_stage(self, stage):
+        # Swap in the stage the worker has prepared, or build it here if the stream is at another stage
+        prefetched_stage, blocks = self.stage_stream.next()
+        if prefetched_stage != stage:
+            return self.create_block_grid(stage)
+        self.place_blocks(blocks)
+
+    def build_blocks(self, layout):
+        # Runs on the prefetch thread, the blocks are only added to the level by place_blocks
+        return [BLOCK_TYPES[code](self.game, self, code, 40+j*60, 80+i*30) for i, j, code in layout]
+
+    def place_blocks(self, blocks):
+        self.block_group.add(blocks)
+        for block in blocks:
+            self.block_grid.add(block)
+        self.blocks_version += 1
+        # The background has to be composed again with the new blocks
+        self.invalidate()
     
     def lose_live(self):
         if self.lives == 0:
             self.game_over()
         else:
-            self.lose_live_sound.play()
-            sleep(1)
-            self.lives -= 1
-            self.reset()
+            self.game.audio.play(self.lose_live_sound, LIFE_LOST)
+            self.pause(1, 'LIFE LOST', self.finish_lose_live)
+
+    def finish_lose_live(self):
+        self.lives -= 1
+        self.reset()
     
     def check_stage_completion(self):
-        if len(self.block_group) == 0:
+        if len(self.block_group) == 0 and not self.is_paused:
             self.score += 1000*self.stage
             self.stage += 1
             self.start_new_stage(self.stage)
     
     def start_new_stage(self, stage):
-        self.next_stage_sound.play()
-        sleep(0.5)
+        self.game.audio.play(self.next_stage_sound, STAGE_CLEAR)
+        self.pause(0.5, f'STAGE {stage}', lambda: self.finish_new_stage(stage))
 
+    def finish_new_stage(self, stage):
         for ball in self.ball_group:
             ball.kill()
+        if self.ball_engine is not None:
+            self.ball_engine.clear()
 
         self.player.is_magnetic = True
-        self.ball = Ball(self.game, self, self.player.rect.centerx, self.player.rect.top, PI, 400)
-        self.create_block_grid(stage)
+        self.ball = self.spawn_ball(self.player.rect.centerx, self.player.rect.top, PI, 400)
+        self.load_stage(stage)
 
     
+    def pause(self, duration, message, callback):
+        # Freeze the balls for a while without blocking the game loop
+        def resume():
+            self.is_paused = False
+            self.pause_message = ''
+            callback()
+        self.is_paused = True
+        self.pause_message = message
+        self.pause_timer = self.game.scheduler.after(duration, resume)
+
+    def exit_state(self):
+        # A pending pause must not fire once the level is gone
+        if self.pause_timer:
+            self.pause_timer.cancel()
+        self.stage_stream.close()
+        # Unmaps the stage packs, a stage the worker was still reading ends it with an error nobody waits for
+        for pack in self.stage_packs if self.endless else [self.stage_pack]:
+            pack.close()
+        State.exit_state(self)
+
     def spawn_ball(self, x, y, angle, speed):
-        Ball(self.game, self, x, y, angle, speed)
+        # Ball limit from the options, returns None instead of a ball when it is reached
+        if self.ball_count() >= self.game.max_balls:
+            return None
+        if self.ball_engine is not None:
+            return self.ball_engine.spawn(x, y, angle, speed)
+        return Ball(self.game, self, x, y, angle, speed)
+
+    def ball_states(self):
+        # (x, y, velocity x, velocity y) of every ball, whichever engine runs them
+        if self.ball_engine is not None:
+            n = len(self.ball_engine)
+            return [(x, y, velocity_x, velocity_y) for (x, y), (velocity_x, velocity_y)
+                    in zip(self.ball_engine.position[:n].tolist(), self.ball_engine.velocity[:n].tolist())]
+        return [(ball.position[0], ball.position[1], ball.velocity[0], ball.velocity[1]) for ball in self.ball_group]
+
+    def profile_counts(self):
+        return {'balls': self.ball_count(), 'blocks': len(self.block_group)}
+
+    def ball_positions(self):
+        if self.ball_engine is not None:
+            return self.ball_engine.position[:len(self.ball_engine)]
+        return np.array([tuple(ball.position) for ball in self.ball_group]).reshape(-1, 2)
+
+    def ball_count(self):
+        if self.ball_engine is not None:
+            return len(self.ball_engine)
+        return len(self.ball_group)
     
     def reset(self):
         self.player.is_magnetic = True
-        self.ball2 = Ball(self.game, self, self.player.rect.centerx, self.player.rect.top, PI, 400)
+        self.ball2 = self.spawn_ball(self.player.rect.centerx, self.player.rect.top, PI, 400)
     
     def display_hud(self, surface):
-        score_text = self.hud_font.render(f'{self.score}', True, (255, 255, 255))
-        score_rect = score_text.get_rect()
-        score_rect.topleft = (50, 10)
-        surface.blit(score_text, score_rect)
+        self.display_sidebars(surface)
+        self.display_status(surface)
 
+    def display_sidebars(self, surface):
         surface.blit(self.sidebar, self.sidebar_l_rect)
         surface.blit(self.sidebar, self.sidebar_r_rect)
 
-        for i in range(self.lives):
+    def display_status(self, surface, snapshot=None):
+        # Score, lives and message of the live level, or of a snapshot
+        if snapshot is None:
+            score, lives, message = self.score, self.lives, self.pause_message
+        else:
+            score, lives, message = snapshot.score, snapshot.lives, snapshot.message
+        score_text = self.game.text_cache.render(self.hud_font, f'{score}', (255, 255, 255))
+        score_rect = score_text.get_rect()
+        score_rect.topleft = (50, 10)
+        drawn_rects = [surface.blit(score_text, score_rect)]
+
+        for i in range(lives):
             live_indicator_rect = self.live_indicator.get_rect()
             live_indicator_rect.topright = (self.game.GAME_WIDTH-50-i*82, 10)
-            surface.blit(self.live_indicator, live_indicator_rect)
+            drawn_rects.append(surface.blit(self.live_indicator, live_indicator_rect))
+
+        if message:
+            drawn_rects.append(self.game.draw_text(surface, self.hud_font, message, (255, 255, 255),
+                                                   self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT*2/3))
+        return drawn_rects
         
 
     def game_over(self):
-        # Temporary, for testing
+        # Queued to the score store's writer thread, the frame loop doesn't wait for the disk
+        if self.game.scores is not None:
+            self.game.scores.submit(self.game.player_name, self.stage_set, self.score, self.stage)
         self.exit_state()
 
 
@@ -158,7 +437,7 @@ class Player(pygame.sprite.Sprite):
         # Make the ball stick to the paddle at the begining of each game
         self.is_magnetic = True
         # Set player sprite and position
-        self.image = pygame.image.load(PurePath(self.game.sprites_dir, 'player', 'paddle.png'))
+        self.image = self.game.load_image('player', 'paddle.png')
         self.rect = self.image.get_rect()
         self.rect.centerx = self.game.GAME_WIDTH/2
         self.rect.bottom = self.game.GAME_HEIGHT - 14
@@ -166,16 +445,16 @@ class Player(pygame.sprite.Sprite):
         self.level.player_group.add(self)
     
     def update(self, delta_time, keys):
-        # Scale mouse position to the display surface
-        mouse_x = pygame.mouse.get_pos()[0] * (self.game.GAME_WIDTH / self.game.SCREEN_WIDTH)
-        self.rect.centerx = mouse_x
+        # The controller is the mouse when playing, or a bot in headless runs
+        paddle_x, release = self.game.controller.paddle_input(self.level)
+        self.rect.centerx = paddle_x
         if self.rect.left < 40:
             self.rect.left = 40
         elif self.rect.right > self.game.GAME_WIDTH-40:
             self.rect.right = self.game.GAME_WIDTH-40
         # Demagnetize paddle to start game     
         if self.is_magnetic:
-            if pygame.mouse.get_pressed()[0]:
+            if release:
                 self.is_magnetic = False
 
     def render(self, surface):
@@ -190,7 +469,7 @@ class Ball(pygame.sprite.Sprite):
         self.max_speed = 1000
         self.min_speed = 300
 
-        self.image = pygame.image.load(PurePath(game.sprites_dir, 'ball', 'ball.png'))
+        self.image = self.game.load_image('ball', 'ball.png')
         self.rect = self.image.get_rect()
         self.rect.center = (x, y)
         self.speed = speed
@@ -207,71 +486,20 @@ class Ball(pygame.sprite.Sprite):
         if self.level.player.is_magnetic:
             self.rect.centerx = self.level.player.rect.centerx
             self.rect.bottom  = self.level.player.rect.top
-            self.position = vector(self.rect.centerx, self.rect.bottom)
+            self.position = vector(self.rect.center)
         else:
-            self.position += self.velocity * delta_time
+            # Swept movement, so even the fastest ball can't skip a wall, the paddle or a block
+            move_ball(self, delta_time)
             self.rect.center = self.position
-            self.wall_collide()
-            self.player_collide()
-            self.block_collide()
             self.crash()
 
     def render(self, surface):
         surface.blit(self.image, self.rect)
     
-    def player_collide(self):
-        if pygame.sprite.spritecollide(self, self.level.player_group, False) and self.velocity[1] > 0:
-            self.level.bounce_sound.play()
-            ball_x = self.rect.centerx
-            player_x = self.level.player.rect.centerx
-            player_width = self.level.player.rect[2]
-
-            # Set new ball angle depending on collide position - the closer to player center the more vertical the angle
-            # The 0.8 is there to ensure min bounce angle is 18deg so that the ball don't bounce too horizontally
-            self.angle = PI + 0.8 * PI * (player_x - ball_x)/player_width
-
-            # Speed up the ball
-            if self.speed <= self.max_speed:
-                self.speed += 10
-
-            # Set new ball velocity
-            self.velocity[1] = -abs(self.velocity[1])
-            self.velocity = vector(sin(self.angle)*self.speed, cos(self.angle)*self.speed)
-    
-    def block_collide(self):
-        collision_tolerance = 8
-        collided_blocks = pygame.sprite.spritecollide(self, self.level.block_group, False)
-        if collided_blocks:
-            # Check both ball position and direction to ensure no multiple collision detections occur
-            # Collision from the bottom
-            if abs(collided_blocks[0].rect.bottom - self.rect.top) < collision_tolerance and self.velocity[1] < 0:
-                collided_blocks[0].get_hit(self, 'bottom')
-            # Collision from the top
-            if abs(collided_blocks[0].rect.top - self.rect.bottom) < collision_tolerance and self.velocity[1] > 0:
-                collided_blocks[0].get_hit(self, 'top')
-            # Collision from the left
-            if abs(collided_blocks[0].rect.left - self.rect.right) < collision_tolerance and self.velocity[0] > 0:
-                collided_blocks[0].get_hit(self, 'left')
-            # Collision from the right
-            if abs(collided_blocks[0].rect.right - self.rect.left) < collision_tolerance and self.velocity[0] < 0:
-                collided_blocks[0].get_hit(self, 'right')
-  
-            
-    def wall_collide(self):
-        # Check both ball position and direction to ensure no multiple collision detections occur
-        if self.rect.right >= self.game.GAME_WIDTH-40 and self.velocity[0] > 0:
-            self.level.hit_wall_sound.play()
-            self.velocity[0] = -abs(self.velocity[0])
-        if self.rect.left <= 40 and self.velocity[0] < 0:
-            self.level.hit_wall_sound.play()
-            self.velocity[0] = abs(self.velocity[0])
-        if self.rect.top <= 0 and self.velocity[1] < 0:
-            self.level.hit_wall_sound.play()
-            self.velocity[1] = abs(self.velocity[1])
-    
     def crash(self):
         if self.rect.top > self.game.GAME_HEIGHT+20:
             self.kill()
+            self.level.balls_lost += 1
             if len(self.level.ball_group) == 0:
                 self.level.lose_live()
 
@@ -284,21 +512,33 @@ class Block(pygame.sprite.Sprite):
         self.game = game
         self.level = level
         self.code = code
-        self.hit_sound = pygame.mixer.Sound(PurePath(self.game.sounds_dir, 'hit_block.wav'))
+        self.hit_sound = self.game.load_sound('hit_block.wav')
 
-        self.image = pygame.image.load(PurePath(game.sprites_dir, 'blocks', f'{self.code}.png'))
+        self.image = self.game.load_image('blocks', f'{self.code}.png')
         self.rect = self.image.get_rect()
         self.rect.topleft = (x, y)
 
-        self.level.block_group.add(self)
+    def kill(self):
+        # Keep the spatial index and the cached background in sync with the sprite group
+        self.level.block_grid.remove(self)
+        self.level.erase_block(self.rect)
+        super().kill()
 
     def render(self, surface):
         surface.blit(self.image, self.rect)
+
+    def shatter(self):
+        # Debris in the block's average color, then the block is gone
+        colors = self.level.debris_colors
+        if self.code not in colors:
+            colors[self.code] = pygame.transform.average_color(self.image)
+        self.level.add_debris(self.rect, colors[self.code])
+        self.kill()
     
     def get_hit(self, ball, side):
-        self.hit_sound.play()
+        self.game.audio.play(self.hit_sound, BLOCK_HIT)
         self.level.score += 8
-        self.kill()
+        self.shatter()
         if side == 'bottom':
             ball.velocity[1] = abs(ball.velocity[1])
         elif side == 'top':
@@ -311,7 +551,7 @@ class Block(pygame.sprite.Sprite):
 class SpeedUpBlock(Block):
     def __init__(self, game, level, code, x, y):
         super().__init__(game, level, code, x, y)
-        self.hit_sound = pygame.mixer.Sound(PurePath(self.game.sounds_dir, 'speed_up.wav'))
+        self.hit_sound = self.game.load_sound('speed_up.wav')
     
     def get_hit(self, ball, side):
         ball.speed = ball.max_speed
@@ -321,7 +561,7 @@ class SpeedUpBlock(Block):
 class SlowDownBlock(Block):
     def __init__(self, game, level, code, x, y):
         super().__init__(game, level, code, x, y)
-        self.hit_sound = pygame.mixer.Sound(PurePath(self.game.sounds_dir, 'slow_down.wav'))
+        self.hit_sound = self.game.load_sound('slow_down.wav')
     
     def get_hit(self, ball, side):
         if ball.speed*0.5 > ball.min_speed:
@@ -334,25 +574,25 @@ class SlowDownBlock(Block):
 class IceBlock(Block):
     def __init__(self, game, level, code, x, y):
         super().__init__(game, level, code, x, y)
-        self.hit_sound = pygame.mixer.Sound(PurePath(self.game.sounds_dir, 'ice_break.wav'))
+        self.hit_sound = self.game.load_sound('ice_break.wav')
     
     def get_hit(self, ball, side):
         super().get_hit(ball, side)
-        ball_angle = random.uniform(0, 2*PI)
+        ball_angle = self.level.rng.uniform(0, 2*PI)
         self.level.spawn_ball(self.rect.centerx, self.rect.centery, ball_angle, ball.speed)
 
 class BottomShieldBlock(Block):
     def __init__(self, game, level, code, x, y):
         super().__init__(game, level, code, x, y)
-        self.hit_shield_sound = pygame.mixer.Sound(PurePath(self.game.sounds_dir, 'hit_shield.wav'))
+        self.hit_shield_sound = self.game.load_sound('hit_shield.wav')
     def get_hit(self, ball, side):
         if side == 'bottom':
             ball.velocity[1] = abs(ball.velocity[1])
-            self.hit_shield_sound.play()
+            self.game.audio.play(self.hit_shield_sound, BLOCK_HIT)
         else:
-            self.hit_sound.play()
+            self.game.audio.play(self.hit_sound, BLOCK_HIT)
             self.level.score += 15
-            self.kill()
+            self.shatter()
             if side == 'top':
                 ball.velocity[1] = -abs(ball.velocity[1])
             elif side == 'left':
@@ -363,6 +603,26 @@ class BottomShieldBlock(Block):
 
 
 
+# Stage sets endless mode cycles through
+ENDLESS_STAGE_SETS = (PurePath('stages', 'standard_set.csv'), PurePath('stages', 'test_set1.csv'))
+
+# Block class for every stage code, e.g. 'SPD1' -> SpeedUpBlock
+BLOCK_CLASSES = {'STD': Block, 'SPD': SpeedUpBlock, 'SLD': SlowDownBlock, 'ICE': IceBlock, 'BSHI': BottomShieldBlock}
+BLOCK_TYPES = {code: BLOCK_CLASSES[code.rstrip('0123456789')] for code in BLOCK_CODES}
+
+
+def preload(game, stage_set=PurePath('stages', 'test_set1.csv')):
+    # What a GameLevel loads, put into the asset cache by the warm-up thread while the menu is up. Not its font,
+    # SDL_ttf isn't thread safe and the main thread is rendering text meanwhile, see Game.load_states
+    for path in [('ball', 'ball.png'), ('player', 'paddle.png'), ('other', 'sidebar.png'),
+                 ('other', 'live_indicator.png')] + [('blocks', f'{code}.png') for code in BLOCK_CODES]:
+        game.load_image(*path)
+    for name in ('bounce.wav', 'hit_block.wav', 'hit_wall.wav', 'lose_live.wav', 'next_stage.wav',
+                 'speed_up.wav', 'slow_down.wav', 'ice_break.wav', 'hit_shield.wav'):
+        game.load_sound(name)
+    # Compiles the stage pack if it is out of date
+    load_stage_pack(stage_set).close()
+
 
 class Powerup():
     pass
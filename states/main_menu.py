@@ -1,17 +1,15 @@
-import pygame
-from pathlib import PurePath
 
 from states.state import State
-from states.level import GameLevel
-from states.options import MenuOptions
-from states.scores import HighScores
+from engine.audio import UI
 
 class MainMenu(State):
     def __init__(self, game):
         State.__init__(self, game)
+        self.idle = True
 
-        self.menu_options = {0: 'START GAME', 1: 'OPTIONS', 2: 'HIGH SCORES', 3: 'QUIT'}
+        self.menu_options = {0: 'START GAME', 1: 'ENDLESS', 2: 'OPTIONS', 3: 'HIGH SCORES', 4: 'QUIT'}
         self.index = 0
+        self.rendered_index = None
 
         self.title_font1 = self.set_font('FastHand-lgBMV.ttf', 140)
         self.title_font2 = self.set_font('FastHand-lgBMV.ttf', 150)
@@ -20,7 +18,7 @@ class MainMenu(State):
         self.menu_choose_font1 = self.set_font('PilotCommand-3zn93.ttf', 48)
         self.menu_choose_font2 = self.set_font('PilotCommand-3zn93.ttf', 51)
 
-        self.menu_blip = pygame.mixer.Sound(PurePath(self.game.sounds_dir, 'menu_blip.wav'))
+        self.menu_blip = self.game.load_sound('menu_blip.wav')
     
     def update(self, delta_time, keys):
         self.update_curson(keys)
@@ -32,35 +30,48 @@ class MainMenu(State):
         return self.game.load_font(name, size)
 
     def render(self, surface):
+        # The menu is static, so it is only drawn again when the selection changes
+        if not self.full_redraw and self.rendered_index == self.index:
+            return []
+        self.full_redraw = False
+        self.rendered_index = self.index
         surface.fill((0, 0, 0))
-        self.game.draw_text(surface, self.menu_choose_font1, self.menu_options[self.index], (127, 112, 138), self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT/2 - 90 + self.index*60)
+        self.game.draw_text(surface, self.menu_choose_font1, self.menu_options[self.index], (127, 112, 138), self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT/2 - 120 + self.index*60)
         self.game.draw_text(surface, self.title_font1, 'PYKANOID', (127, 112, 138), self.game.GAME_WIDTH/2, 100)
         self.game.draw_text(surface, self.title_font2, 'PYKANOID', (255, 255, 255), self.game.GAME_WIDTH/2, 100)
         self.game.draw_text(surface, self.title_font3, 'PYKANOID', (77, 155, 230), self.game.GAME_WIDTH/2, 100)
-        self.game.draw_text(surface, self.menu_font, 'START GAME', (255, 255, 255), self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT/2 - 90)
-        self.game.draw_text(surface, self.menu_font, 'OPTIONS', (255, 255, 255), self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT/2 - 30)
-        self.game.draw_text(surface, self.menu_font, 'HIGH SCORES', (255, 255, 255), self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT/2 + 30)
-        self.game.draw_text(surface, self.menu_font, 'QUIT', (255, 255, 255), self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT/2 + 90)
-        self.game.draw_text(surface, self.menu_choose_font2, self.menu_options[self.index], (77, 155, 230), self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT/2 - 90 + self.index*60)
+        for i, option in self.menu_options.items():
+            self.game.draw_text(surface, self.menu_font, option, (255, 255, 255), self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT/2 - 120 + i*60)
+        self.game.draw_text(surface, self.menu_choose_font2, self.menu_options[self.index], (77, 155, 230), self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT/2 - 120 + self.index*60)
         # surface.blit(self.circle_surf(200, (20, 20, 20)), (200,200), special_flags=pygame.BLEND_RGB_ADD)
         # surface.blit(self.circle_surf(150, (30, 0, 0)), (200,200), special_flags=pygame.BLEND_RGB_ADD)
     
     def update_curson(self, keys):
         if keys['down']:
-            self.menu_blip.play()
+            self.game.audio.play(self.menu_blip, UI)
             self.index = (self.index + 1) % len(self.menu_options)
         if keys['up']:
-            self.menu_blip.play()
+            self.game.audio.play(self.menu_blip, UI)
             self.index = (self.index - 1) % len(self.menu_options)
     
     def transition_state(self):
+        # States are imported on first use, so they don't slow down startup
         if self.menu_options[self.index] == 'START GAME':
+            from states.level import GameLevel
+            self.game.mark_startup('start pressed')
             new_state = GameLevel(self.game)
             new_state.enter_state()
+        if self.menu_options[self.index] == 'ENDLESS':
+            from states.level import GameLevel
+            self.game.mark_startup('start pressed')
+            new_state = GameLevel(self.game, stage=1, endless=True)
+            new_state.enter_state()
         if self.menu_options[self.index] == 'OPTIONS':
+            from states.options import MenuOptions
             new_state = MenuOptions(self.game)
             new_state.enter_state()
         if self.menu_options[self.index] == 'HIGH SCORES':
+            from states.scores import HighScores
             new_state = HighScores(self.game)
             new_state.enter_state()
         if self.menu_options[self.index] == 'QUIT':
@@ -1,18 +1,82 @@
 from pathlib import PurePath
 from states.state import State
+from engine.settings import PRESETS
 
 class MenuOptions(State):
     def __init__(self, game):
         self.game = game
         State.__init__(self, game)
+        self.idle = True
 
         self.font = self.game.load_font('PilotCommand-3zn93.ttf', 50)
-    
+        self.row_font = self.game.load_font('PilotCommand-3zn93.ttf', 36)
+        self.hint_font = self.game.load_font('PilotCommand-3zn93.ttf', 24)
+
+        # (label, setting), the preset row sets all of them at once
+        self.rows = [('PRESET', None), ('WINDOW SIZE', 'resolution'), ('FPS CAP', 'fps_cap'), ('VSYNC', 'vsync'),
+                     ('SCALING', 'scale_mode'), ('AUDIO BUFFER', 'audio_buffer'),
+                     ('AUDIO CHANNELS', 'audio_channels'), ('MAX BALLS', 'max_balls'),
+                     ('FPS OVERLAY', 'fps_overlay'), ('SIM THREAD', 'sim_thread'),
+                     ('AUTO QUALITY', 'auto_quality'), ('BACK', None)]
+        self.index = 0
+        self.presets = list(PRESETS)
+
     def update(self, delta_time, keys):
-        if keys['escape']:
+        label, setting = self.rows[self.index]
+        if keys['escape'] or (keys['enter'] and label == 'BACK'):
             self.exit_state()
+        elif keys['down'] or keys['up']:
+            self.index = (self.index + (1 if keys['down'] else -1)) % len(self.rows)
+            self.invalidate()
+        elif keys['right'] or keys['left'] or keys['enter']:
+            step = -1 if keys['left'] else 1
+            if label == 'PRESET':
+                preset = self.game.settings.preset()
+                index = self.presets.index(preset) + step if preset else 0
+                self.game.settings.apply_preset(self.presets[index % len(self.presets)])
+            elif setting:
+                self.game.settings.cycle(setting, step)
+            if label != 'BACK':
+                self.game.settings.save()
+                self.game.apply_settings()
+                self.invalidate()
         self.game.reset_keys()
 
+    def value_text(self, label, setting):
+        settings = self.game.settings
+        if label == 'PRESET':
+            return settings.preset() or 'CUSTOM'
+        if setting is None:
+            return ''
+        value = settings[setting]
+        if setting == 'resolution':
+            return f'{value[0]} X {value[1]}'
+        if setting == 'fps_cap':
+            return f'{value}' if value else 'UNCAPPED'
+        if setting == 'audio_buffer':
+            # Takes a restart, the mixer can't change its buffer while running
+            return f'{value} (RESTART)' if value != self.game.audio.buffer else f'{value}'
+        if isinstance(value, bool):
+            return 'ON' if value else 'OFF'
+        return f'{value}'.upper()
+
     def render(self, surface):
+        # Static screen, only drawn again when a setting or the selection changes
+        if not self.full_redraw:
+            return []
+        self.full_redraw = False
         surface.fill((0, 0, 0))
-        self.game.draw_text(surface, self.font, 'OPTIONS GO HERE', (255, 255, 255), self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT/2)
+        self.game.draw_text(surface, self.font, 'OPTIONS', (255, 255, 255), self.game.GAME_WIDTH/2, 100)
+        for i, (label, setting) in enumerate(self.rows):
+            color = (77, 155, 230) if i == self.index else (255, 255, 255)
+            y = 190 + i*55
+            self.draw_column(surface, label, color, 'midright', (self.game.GAME_WIDTH/2 - 30, y))
+            self.draw_column(surface, self.value_text(label, setting), color, 'midleft', (self.game.GAME_WIDTH/2 + 30, y))
+        self.game.draw_text(surface, self.hint_font, 'UP/DOWN SELECT   LEFT/RIGHT CHANGE   ESC BACK', (127, 112, 138),
+                            self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT - 60)
+
+    def draw_column(self, surface, text, color, anchor, position):
+        if not text:
+            return
+        text_surface = self.game.text_cache.render(self.row_font, text, color)
+        surface.blit(text_surface, text_surface.get_rect(**{anchor: position}))
@@ -5,14 +5,72 @@ class HighScores(State):
     def __init__(self, game):
         self.game = game
         State.__init__(self, game)
+        self.idle = True
 
         self.font = self.game.load_font('PilotCommand-3zn93.ttf', 50)
-    
+        self.row_font = self.game.load_font('PilotCommand-3zn93.ttf', 36)
+        self.hint_font = self.game.load_font('PilotCommand-3zn93.ttf', 24)
+
+        # Only the page on screen is read from the store
+        self.page_size = 10
+        self.page = 0
+        self.rows = []
+        self.pages = 1
+        # None shows every stage set, left and right cycle through the sets that have scores
+        self.filters = [None]
+        if self.game.scores is not None:
+            self.filters += self.game.scores.stage_sets()
+        self.filter_index = 0
+        self.load_page()
+
     def update(self, delta_time, keys):
         if keys['escape']:
             self.exit_state()
+        elif keys['down'] and self.page + 1 < self.pages:
+            self.page += 1
+            self.load_page()
+        elif keys['up'] and self.page > 0:
+            self.page -= 1
+            self.load_page()
+        elif keys['right'] or keys['left']:
+            self.filter_index = (self.filter_index + (1 if keys['right'] else -1)) % len(self.filters)
+            self.page = 0
+            self.load_page()
         self.game.reset_keys()
 
+    def load_page(self):
+        if self.game.scores is not None:
+            stage_set = self.filters[self.filter_index]
+            self.rows = self.game.scores.top(self.page_size, self.page * self.page_size, stage_set)
+            self.pages = max(-(-self.game.scores.count(stage_set) // self.page_size), 1)
+        self.invalidate()
+
     def render(self, surface):
+        # Static screen, only drawn again when the page changes
+        if not self.full_redraw:
+            return []
+        self.full_redraw = False
         surface.fill((0, 0, 0))
-        self.game.draw_text(surface, self.font, 'SCORES GO HERE', (255, 255, 255), self.game.GAME_WIDTH/2, self.game.GAME_HEIGHT/2)
+        center = self.game.GAME_WIDTH/2
+        stage_set = self.filters[self.filter_index]
+        self.game.draw_text(surface, self.font, 'HIGH SCORES', (255, 255, 255), center, 100)
+        self.game.draw_text(surface, self.row_font, stage_set.upper() if stage_set else 'ALL STAGE SETS',
+                            (77, 155, 230), center, 170)
+
+        if not self.rows:
+            self.game.draw_text(surface, self.row_font, 'NO SCORES YET', (255, 255, 255), center, 400)
+        for i, (player, row_stage_set, score, stage) in enumerate(self.rows):
+            rank = self.page * self.page_size + i + 1
+            y = 250 + i*55
+            # Columns are aligned one by one, the font isn't monospaced
+            self.draw_column(surface, f'{rank}.', 'midright', (360, y))
+            self.draw_column(surface, player[:12], 'midleft', (390, y))
+            self.draw_column(surface, f'{score}', 'midright', (860, y))
+            self.draw_column(surface, f'STAGE {stage}', 'midleft', (910, y))
+
+        self.game.draw_text(surface, self.hint_font, f'PAGE {self.page + 1}/{self.pages}   UP/DOWN PAGE   '
+                            'LEFT/RIGHT STAGE SET   ESC BACK', (127, 112, 138), center, self.game.GAME_HEIGHT - 60)
+
+    def draw_column(self, surface, text, anchor, position):
+        text_surface = self.game.text_cache.render(self.row_font, text, (255, 255, 255))
+        surface.blit(text_surface, text_surface.get_rect(**{anchor: position}))
@@ -2,13 +2,37 @@ class State():
     def __init__(self, game):
         self.game = game
         self.prev_state = None
+        # Set whenever the canvas no longer holds this state's last frame
+        self.full_redraw = True
+        # Idle states (menus, pause screens) run at a low frame rate
+        self.idle = False
+        # Set by states the player plays in, for the startup report
+        self.playable = False
+        # Profiler scope the game loop times this state's update under
+        self.update_scope = f'{type(self).__name__}.update'
+        # Set by states that can be stepped on the simulation thread, they render from snapshot() instead
+        self.threadable = False
+        # The snapshot buffer while a simulation thread steps this state
+        self.snapshots = None
     
     def update(self):
         pass
 
     def render(self, surface):
+        # Return a list of changed rects, or None when the whole canvas was redrawn
         pass
 
+    def profile_counts(self):
+        # Entity counts shown in the profiler overlay
+        return {}
+
+    def snapshot(self, time):
+        # Immutable copy of what render needs, published by the simulation thread after every step
+        return None
+
+    def invalidate(self):
+        self.full_redraw = True
+
     def enter_state(self):
         if len(self.game.state_stack) > 1:
             self.prev_state = self.game.state_stack[-1]
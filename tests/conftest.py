@@ -0,0 +1,13 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The game loads its assets and stages relative to the repository root
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture(autouse=True)
+def repository_root(monkeypatch):
+    monkeypatch.chdir(ROOT)
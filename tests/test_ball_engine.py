@@ -0,0 +1,40 @@
+from math import pi
+from pathlib import PurePath
+
+import numpy as np
+import pytest
+
+
+def play(ball_mode, extra_balls, steps=6000, check_every=100):
+    '''Play a seeded stage with the ball tracking bot and extra balls, returning the state every check_every steps'''
+    from pyknoid import Game
+    from engine.controllers import BallTrackingBot
+    from states.level import GameLevel
+
+    game = Game(headless=True, seed=7)
+    game.ball_mode = ball_mode
+    game.controller = BallTrackingBot(game)
+    level = GameLevel(game, stage_set=PurePath('stages', 'test_set1.csv'), stage=3)
+    level.enter_state()
+    level.lives = 100
+    for i in range(extra_balls):
+        level.spawn_ball(100 + i * 37 % 1000, 700, pi + 0.3 + i * 0.05, 400)
+    states = []
+    for step in range(1, steps + 1):
+        game.step()
+        if step % check_every == 0:
+            # The engines keep their balls in different orders
+            states.append((level.score, level.lives, level.balls_lost, len(level.block_group),
+                           np.array(sorted(level.ball_states())).reshape(-1, 4)))
+    if game.state_stack[-1] is level:
+        level.exit_state()
+    return states
+
+
+@pytest.mark.parametrize('extra_balls', [0, 30, 60])
+def test_numpy_engine_matches_sprites(extra_balls):
+    sprite, numpy = play('sprite', extra_balls), play('numpy', extra_balls)
+    for step, (expected, actual) in enumerate(zip(sprite, numpy)):
+        assert actual[:4] == expected[:4], f'score, lives, balls lost or blocks differ at check {step}'
+        assert actual[4].shape == expected[4].shape, f'ball count differs at check {step}'
+        np.testing.assert_allclose(actual[4], expected[4], atol=1e-6)
@@ -0,0 +1,37 @@
+import engine.settings
+
+
+def press(key):
+    # One frame with the key down and one with it up again
+    return [[(key, True)], [(key, False)]]
+
+
+def test_replay_keeps_the_recorded_ball_limit(tmp_path, monkeypatch):
+    from pyknoid import Game
+    from tools.replay import replay
+
+    # Recorded on a machine with a ball limit of 50, which only changes the frame cap on the options screen
+    monkeypatch.setitem(engine.settings.DEFAULTS, 'max_balls', 50)
+    path = str(tmp_path / 'session.pkrec')
+    game = Game(headless=True, seed=11, record=path)
+    frames = (press('down') + press('down') + press('enter')
+              + press('down') + press('down') + press('right') + press('escape')
+              + press('up') + press('up') + press('enter') + press('button'))
+    # Then holds up for a ball every few frames, well past the limit
+    frames += [[('up', frame % 4 == 0)] for frame in range(1200)]
+    for deltas in frames:
+        game.dt = 1/60
+        game.recorder.record_frame(game.dt, deltas)
+        game.apply_input(deltas)
+        game.update()
+    game.recorder.close()
+    level = game.state_stack[-1]
+    assert game.settings['fps_cap'] != engine.settings.DEFAULTS['fps_cap']
+    assert type(level).__name__ == 'GameLevel' and level.ball_count() == 50
+
+    # Replayed where the default limit is 200
+    monkeypatch.setitem(engine.settings.DEFAULTS, 'max_balls', 200)
+    replayed, _, _, _ = replay(path, render=False)
+    replayed_level = replayed.state_stack[-1]
+    assert replayed.max_balls == 50
+    assert (replayed_level.score, replayed_level.ball_count()) == (level.score, level.ball_count())
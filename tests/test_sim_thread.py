@@ -0,0 +1,114 @@
+import threading
+from time import perf_counter, sleep
+
+import pytest
+
+from engine.sim_thread import Snapshot, SnapshotBuffer, SimulationThread
+
+
+def numbered(time):
+    return Snapshot(time, 0, None, (), 0, 0, 0, '', False)
+
+
+def test_snapshot_pairs_are_consecutive_and_never_go_back():
+    buffer = SnapshotBuffer(numbered(0))
+    publishes = 100000
+    errors = []
+
+    def publish():
+        for time in range(1, publishes + 1):
+            buffer.publish(numbered(time))
+
+    def read():
+        last = 0
+        while last < publishes:
+            previous, latest = buffer.read()
+            if latest.time not in (previous.time, previous.time + 1) or latest.time < last:
+                errors.append((last, previous.time, latest.time))
+                return
+            last = latest.time
+
+    readers = [threading.Thread(target=read, daemon=True) for _ in range(2)]
+    publisher = threading.Thread(target=publish)
+    for thread in readers + [publisher]:
+        thread.start()
+    for thread in readers + [publisher]:
+        thread.join(timeout=60)
+    assert not errors
+    assert buffer.published == publishes
+
+
+def test_interpolation_blends_between_the_two_newest():
+    buffer = SnapshotBuffer(numbered(1.0))
+    buffer.publish(numbered(1.5))
+    assert buffer.interpolation(1.75)[2] == pytest.approx(0.5)
+    assert buffer.interpolation(3.0)[2] == 1
+    assert buffer.interpolation(1.0)[2] == 0
+
+
+@pytest.fixture
+def level():
+    from pyknoid import Game
+    from states.level import GameLevel
+    game = Game(headless=True, seed=1)
+    level = GameLevel(game, stage=1)
+    level.enter_state()
+    yield level
+    if game.simulation is not None:
+        game.simulation.stop()
+    if game.state_stack[-1] is level:
+        level.exit_state()
+
+
+def test_snapshot_arrays_are_read_only(level):
+    level.player.is_magnetic = False
+    level.spawn_ball(400, 600, 3, 400)
+    snapshot = level.snapshot(perf_counter())
+    assert len(snapshot.balls) == level.ball_count()
+    with pytest.raises(ValueError):
+        snapshot.balls[0, 0] = 0
+    # A copy, the simulation moving on doesn't change what was published
+    published = snapshot.balls.copy()
+    level.update(level.game.fixed_dt, level.game.keys)
+    assert (snapshot.balls == published).all()
+    assert (level.ball_positions() != published).any()
+
+
+def test_main_thread_takes_over_when_the_state_leaves_the_stack(level):
+    game = level.game
+    game.threaded = True
+    game.dt = game.fixed_dt
+    game.update()
+    simulation = game.simulation
+    assert isinstance(simulation, SimulationThread) and simulation.is_alive()
+    assert level.snapshots is simulation.buffer
+
+    # Escape goes to the simulation thread, the level exits and the thread ends on its own
+    simulation.push_input([('escape', True)])
+    simulation.thread.join(timeout=5)
+    assert not simulation.is_alive()
+    assert game.state_stack[-1] is not level
+
+    # Input that came in after the thread stopped is applied by the main thread, which steps the menu again
+    simulation.push_input([('mouse', (12, 34))])
+    game.update()
+    assert game.simulation is None
+    assert game.mouse_pos == (12, 34)
+    steps = simulation.steps
+    game.dt = game.fixed_dt
+    game.update()
+    assert game.simulation is None and simulation.steps == steps
+
+
+def test_stop_ends_the_thread(level):
+    game = level.game
+    game.threaded = True
+    game.update()
+    simulation = game.simulation
+    sleep(0.05)
+    assert simulation.steps > 0
+    simulation.stop()
+    assert not simulation.is_alive()
+    steps = simulation.steps
+    sleep(0.02)
+    assert simulation.steps == steps
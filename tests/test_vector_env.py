@@ -0,0 +1,26 @@
+from argparse import Namespace
+
+from engine.vector_env import VectorEnv
+from tools.vector_bench import compare, track_balls
+
+
+def test_vector_env_matches_sprite_levels():
+    # Same seeds and actions in the vectorized games and in sprite GameLevels, every step compared
+    args = Namespace(games=6, steps=240*20, stage_set='stages/test_set1.csv', stages=[1, 3, 4], max_balls=200,
+                     seed=0)
+    assert compare(args)
+
+
+def test_vector_env_matches_sprite_levels_at_the_ball_limit():
+    args = Namespace(games=4, steps=240*20, stage_set='stages/test_set1.csv', stages=[4], max_balls=3, seed=1)
+    assert compare(args)
+
+
+def test_step_resets_finished_games():
+    env = VectorEnv(8, stage_set='stages/test_set1.csv', stages=(1,), seed=0, max_steps=50)
+    observations = env.reset()
+    for step in range(50):
+        observations, rewards, dones = env.step(track_balls(observations, step))
+    assert dones.all()
+    assert (observations['ball_count'] == 1).all()
+    assert (observations['blocks'] > 0).sum(axis=(1, 2)).min() > 0
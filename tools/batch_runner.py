@@ -0,0 +1,76 @@
+import argparse, os, sys
+from multiprocessing import Pool
+from pathlib import PurePath
+
+# Run from the repository root: python -m tools.batch_runner
+sys.path.insert(0, os.getcwd())
+
+
+def play_stage(job):
+    '''Play a single stage headless with the ball tracking bot and report how it went'''
+    stage_set, stage, lives, time_limit, seed, ball_mode = job
+    from pyknoid import Game
+    from engine.controllers import BallTrackingBot
+    from states.level import GameLevel
+
+    game = Game(headless=True, seed=seed)
+    game.ball_mode = ball_mode
+    game.controller = BallTrackingBot(game)
+    level = GameLevel(game, stage_set=PurePath(stage_set), stage=stage)
+    level.enter_state()
+    # Pool workers play many jobs, the level's prefetch thread and stage pack must not outlive the job
+    try:
+        level.lives = lives
+        if len(level.block_group) == 0:
+            return {'stage_set': stage_set, 'stage': stage, 'result': 'empty', 'time': 0,
+                    'balls_lost': 0, 'score': 0, 'blocks_left': 0}
+
+        steps, max_steps = 0, int(time_limit / game.fixed_dt)
+        # The stage is cleared once the level moves on, or lost once the level exits on game over
+        while level.stage == stage and game.state_stack[-1] is level and steps < max_steps:
+            game.step()
+            steps += 1
+
+        if level.stage != stage:
+            result = 'cleared'
+        elif game.state_stack[-1] is not level:
+            result = 'game over'
+        else:
+            result = 'timeout'
+        return {'stage_set': stage_set, 'stage': stage, 'result': result, 'time': steps * game.fixed_dt,
+                'balls_lost': level.balls_lost, 'score': level.score, 'blocks_left': len(level.block_group)}
+    finally:
+        # A game over already took the level off the stack
+        if game.state_stack[-1] is level:
+            level.exit_state()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play every stage of the stage sets headless on all cores')
+    parser.add_argument('stage_sets', nargs='*', default=['stages/standard_set.csv', 'stages/test_set1.csv'])
+    parser.add_argument('--lives', type=int, default=5)
+    parser.add_argument('--time-limit', type=float, default=600, help='simulated seconds per stage')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ball-mode', choices=('sprite', 'numpy'), default='sprite')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    from engine.stage_pack import load_stage_pack
+    jobs = []
+    for stage_set in args.stage_sets:
+        for stage in range(1, len(load_stage_pack(stage_set)) + 1):
+            jobs.append((stage_set, stage, args.lives, args.time_limit, args.seed + stage, args.ball_mode))
+
+    pool = Pool(args.processes)
+    results = sorted(pool.imap_unordered(play_stage, jobs), key=lambda r: (r['stage_set'], r['stage']))
+    pool.close()
+    pool.join()
+
+    print(f"{'stage set':<28}{'stage':>6}  {'result':<10}{'time':>9}{'balls lost':>12}{'score':>8}{'blocks left':>13}")
+    for r in results:
+        print(f"{r['stage_set']:<28}{r['stage']:>6}  {r['result']:<10}{r['time']:>8.1f}s{r['balls_lost']:>12}"
+              f"{r['score']:>8}{r['blocks_left']:>13}")
+
+
+if __name__ == '__main__':
+    main()
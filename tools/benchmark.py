@@ -0,0 +1,172 @@
+import argparse, json, os, platform, random, sys, tracemalloc
+from math import pi as PI
+from pathlib import PurePath
+from time import perf_counter
+
+# Run from the repository root: python -m tools.benchmark
+sys.path.insert(0, os.getcwd())
+
+from pyknoid import Game
+from engine.controllers import BallTrackingBot
+from states.level import GameLevel
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(samples, scale=1000):
+    # Times are reported in milliseconds
+    if not samples:
+        return None
+    samples = [sample * scale for sample in samples]
+    return {'p50': percentile(samples, 0.5), 'p95': percentile(samples, 0.95), 'p99': percentile(samples, 0.99),
+            'mean': sum(samples) / len(samples), 'max': max(samples), 'samples': len(samples)}
+
+
+def timed(obj, name, samples):
+    # Replace a method on one instance with a wrapper that records how long every call takes
+    method = getattr(obj, name)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        result = method(*args, **kwargs)
+        samples.append(perf_counter() - start)
+        return result
+    setattr(obj, name, wrapper)
+
+
+def run_frames(game, frames, warmup):
+    # One render frame per fixed simulation step, returns Game.render times and transient allocations
+    render_times, allocations = [], []
+    for frame in range(warmup + frames):
+        game.step()
+        start = perf_counter()
+        game.render()
+        if frame >= warmup:
+            render_times.append(perf_counter() - start)
+    # Separate, shorter pass under tracemalloc so tracing doesn't skew the timings above
+    tracemalloc.start()
+    for _ in range(min(frames, 60)):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        game.step()
+        game.render()
+        allocations.append((tracemalloc.get_traced_memory()[1] - current) / 1024)
+    tracemalloc.stop()
+    return render_times, allocations
+
+
+def new_level(game, stage_set, stage):
+    level = GameLevel(game, stage_set=PurePath(stage_set), stage=stage)
+    level.enter_state()
+    # Enough lives that a scenario never ends in a game over
+    level.lives = 1000
+    return level
+
+
+def bench_menu(game, args):
+    update_times = []
+    timed(game.main_menu, 'update', update_times)
+    render_times, allocations = run_frames(game, args.frames, args.warmup)
+    return {'state.update': summarize(update_times[-args.frames:]), 'game.render': summarize(render_times),
+            'alloc_kib': summarize(allocations, scale=1)}
+
+
+def bench_level(game, args, stage_set, stage, balls=0):
+    game.controller = BallTrackingBot(game)
+    level = new_level(game, stage_set, stage)
+
+    # Building the block grid on its own, repeated on a fresh grid
+    grid_times = []
+    for _ in range(args.grid_repeats):
+        for block in list(level.block_group):
+            block.kill()
+        start = perf_counter()
+        level.create_block_grid(stage)
+        grid_times.append(perf_counter() - start)
+
+    level.player.is_magnetic = False
+    for _ in range(balls - 1):
+        level.spawn_ball(random.uniform(100, game.GAME_WIDTH - 100), random.uniform(700, 850),
+                         random.uniform(PI/2, 3*PI/2), 400)
+
+    update_times, render_times = [], []
+    timed(level, 'update', update_times)
+    timed(level, 'render', render_times)
+    game_render_times, allocations = run_frames(game, args.frames, args.warmup)
+    level.exit_state()
+    return {'level.update': summarize(update_times[args.warmup:args.warmup + args.frames]),
+            'level.render': summarize(render_times[args.warmup:args.warmup + args.frames]),
+            'create_block_grid': summarize(grid_times),
+            'game.render': summarize(game_render_times),
+            'alloc_kib': summarize(allocations, scale=1),
+            'balls_at_end': level.ball_count()}
+
+
+def compare(results, baseline):
+    # Relative change of every p50/p95 against a saved run, positive means slower
+    print(f"\n{'scenario':<36}{'metric':<20}{'p50':>10}{'p95':>10}")
+    for name, metrics in results['scenarios'].items():
+        for metric, stats in metrics.items():
+            old = baseline['scenarios'].get(name, {}).get(metric)
+            if not isinstance(stats, dict) or not isinstance(old, dict):
+                continue
+            changes = [(stats[key] - old[key]) / old[key] * 100 if old[key] else 0 for key in ('p50', 'p95')]
+            print(f'{name:<36}{metric:<20}{changes[0]:>+9.1f}%{changes[1]:>+9.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the update and render hot paths in fixed scenarios')
+    parser.add_argument('--stage-sets', nargs='*', default=['stages/standard_set.csv', 'stages/test_set1.csv'])
+    parser.add_argument('--balls', nargs='*', type=int, default=[1, 10, 100, 500])
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--warmup', type=int, default=30)
+    parser.add_argument('--grid-repeats', type=int, default=20)
+    parser.add_argument('--ball-mode', choices=('sprite', 'numpy'), default='sprite')
+    parser.add_argument('--render-mode', choices=('full', 'dirty'), default='dirty')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', help='earlier benchmark JSON to compare against')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    game = Game(headless=True, seed=args.seed)
+    game.ball_mode = args.ball_mode
+    game.render_mode = args.render_mode
+    # The ball scenarios go past the default limit from the options
+    game.max_balls = max(args.balls + [game.max_balls])
+
+    scenarios = {'main_menu_idle': bench_menu(game, args)}
+    from engine.stage_pack import load_stage_pack
+    for stage_set in args.stage_sets:
+        pack = load_stage_pack(stage_set)
+        for stage in range(1, len(pack) + 1):
+            # Empty stages are cleared on the first frame, like in the batch runner there is nothing to time
+            if not any(pack.stage_ids(stage)):
+                continue
+            scenarios[f'stage:{PurePath(stage_set).stem}:{stage}'] = bench_level(game, args, stage_set, stage)
+    for balls in args.balls:
+        scenarios[f'balls:{balls}'] = bench_level(game, args, args.stage_sets[0], 1, balls)
+
+    results = {'meta': {'python': platform.python_version(), 'machine': platform.machine(),
+                        'ball_mode': args.ball_mode, 'render_mode': args.render_mode,
+                        'frames': args.frames, 'seed': args.seed},
+               'scenarios': scenarios}
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    print(f"{'scenario':<36}{'metric':<20}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    for name, metrics in scenarios.items():
+        for metric, stats in metrics.items():
+            if isinstance(stats, dict):
+                print(f"{name:<36}{metric:<20}{stats['p50']:>9.3f}{stats['p95']:>9.3f}{stats['p99']:>9.3f}")
+    print(f'Saved to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
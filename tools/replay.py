@@ -0,0 +1,68 @@
+import argparse, os, sys
+from time import perf_counter, sleep
+
+# Run from the repository root: python -m tools.replay session.pkrec
+sys.path.insert(0, os.getcwd())
+
+import pygame
+
+from pyknoid import Game
+from engine.recording import InputPlayback
+from tools.benchmark import summarize
+
+
+def replay(path, headless=True, realtime=False, render=True):
+    '''Play a recorded session back through the game loop and time every frame'''
+    playback = InputPlayback(path)
+    game = Game(headless=headless, seed=playback.seed, replay=True)
+    # Settings that change the simulation are played back as recorded, not taken from settings.json
+    if playback.max_balls is not None:
+        game.max_balls = playback.max_balls
+    frame_times, simulated = [], 0
+    start = perf_counter()
+    for delta_time, deltas in playback:
+        if not game.playing:
+            break
+        simulated += delta_time
+        if realtime:
+            # Keep to the recorded pace instead of running as fast as possible
+            sleep(max(start + simulated - perf_counter(), 0))
+        frame_start = perf_counter()
+        # Live input is ignored, only closing the window ends the replay early
+        if not headless and any(event.type == pygame.QUIT for event in pygame.event.get()):
+            break
+        game.dt = delta_time
+        game.apply_input(deltas)
+        game.update()
+        if render:
+            game.render()
+        frame_times.append(perf_counter() - frame_start)
+    return game, frame_times, simulated, perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a session recorded with pyknoid.py --record')
+    parser.add_argument('recording')
+    parser.add_argument('--window', action='store_true', help='show the replay on screen instead of headless')
+    parser.add_argument('--realtime', action='store_true', help='play at 1x instead of as fast as possible')
+    parser.add_argument('--no-render', action='store_true', help='only run the simulation')
+    args = parser.parse_args()
+
+    game, frame_times, simulated, elapsed = replay(args.recording, headless=not args.window,
+                                                   realtime=args.realtime, render=not args.no_render)
+    stats = summarize(frame_times)
+    print(f'{len(frame_times)} frames, {simulated:.1f} s recorded, replayed in {elapsed:.1f} s')
+    if stats:
+        print(f"Frame work: {stats['p50']:.3f} ms p50, {stats['p95']:.3f} ms p95, "
+              f"{stats['p99']:.3f} ms p99, {stats['max']:.3f} ms max")
+    # The end state, to check that two replays of the same recording agree
+    state = game.state_stack[-1]
+    print(f'Ended in {type(state).__name__}', end='')
+    if hasattr(state, 'score'):
+        print(f', stage {state.stage}, score {state.score}, {state.ball_count()} balls, '
+              f'{len(state.block_group)} blocks left', end='')
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import argparse, os, sys
+from pathlib import PurePath
+from time import perf_counter
+
+import numpy as np
+
+# Run from the repository root: python -m tools.vector_bench
+sys.path.insert(0, os.getcwd())
+
+from engine.vector_env import CELL_HEIGHT, CELL_WIDTH, GRID_X, GRID_Y, VectorEnv
+
+
+def track_balls(observations, step):
+    # Paddle under the lowest ball coming down, hitting it off-center in turn like BallTrackingBot
+    balls, count = observations['balls'], observations['ball_count']
+    slots = np.arange(balls.shape[1])
+    descending = (balls[..., 3] > 0) & (slots < count[:, None])
+    height = np.where(descending, balls[..., 1], -np.inf)
+    lowest = height.argmax(axis=1)
+    offset = ((step // 120 + np.arange(len(count))) % 5 - 2) * 20
+    target = balls[np.arange(len(count)), lowest, 0] + offset
+    return np.where(height.max(axis=1) > -np.inf, target, observations['paddle_x'])
+
+
+class ScriptedController():
+    # Plays back the actions the vectorized games got, always releasing the ball
+    def __init__(self):
+        self.x = 640
+
+    def paddle_input(self, level):
+        return self.x, True
+
+
+def compare(args):
+    '''Play games in the VectorEnv, then the same games as sprite GameLevels with the same seeds and
+    actions, and compare balls, score and blocks after every step until the game ends'''
+    from pyknoid import Game
+    from states.level import GameLevel
+
+    stages = tuple(args.stages)
+    env = VectorEnv(args.games, stage_set=args.stage_set, stages=stages, seed=args.seed, max_balls=args.max_balls,
+                    max_steps=args.steps)
+    observations = env.reset()
+    seeds = env.seeds.copy()
+    # Per game: the actions and the state after every step of its first episode
+    history = [[] for _ in range(args.games)]
+    finished = np.zeros(args.games, dtype=bool)
+    for step in range(args.steps):
+        actions = track_balls(observations, step)
+        observations, rewards, dones = env.step(actions)
+        for i in np.flatnonzero(~finished).tolist():
+            # A finished game was already reset, only its score gain is compared
+            state = None
+            if not dones[i]:
+                state = (observations['balls'][i, :observations['ball_count'][i], :2].copy(),
+                         observations['blocks'][i] > 0)
+            history[i].append((actions[i], rewards[i], state))
+        finished |= dones
+        if finished.all():
+            break
+
+    game = Game(headless=True)
+    game.controller = ScriptedController()
+    game.max_balls = args.max_balls
+    worst, compared, mismatches = 0, 0, 0
+    for i in range(args.games):
+        level = GameLevel(game, stage_set=PurePath(args.stage_set), stage=int(env.stages[i]), seed=int(seeds[i]))
+        level.enter_state()
+        level.lives = 0
+        score = 0
+        for step, (action, reward, state) in enumerate(history[i]):
+            game.controller.x = action
+            game.step()
+            gained, score = level.score - score, level.score
+            if gained != reward:
+                mismatches += 1
+                print(f'game {i} step {step}: score gained {gained} sprite, {reward} vectorized')
+                break
+            if state is None:
+                break
+            positions, blocks = state
+            sprite_positions = np.array([ball[:2] for ball in level.ball_states()]).reshape(-1, 2)
+            sprite_blocks = np.zeros_like(blocks)
+            for block in level.block_group:
+                sprite_blocks[(block.rect.top - GRID_Y) // CELL_HEIGHT, (block.rect.left - GRID_X) // CELL_WIDTH] = True
+            if sprite_positions.shape != positions.shape or (sprite_blocks != blocks).any():
+                mismatches += 1
+                print(f'game {i} step {step}: {len(sprite_positions)} balls and {sprite_blocks.sum()} blocks sprite, '
+                      f'{len(positions)} and {blocks.sum()} vectorized')
+                break
+            error = float(np.abs(sprite_positions - positions).max(initial=0))
+            worst = max(worst, error)
+            compared += 1
+            if error > 1e-6:
+                mismatches += 1
+                print(f'game {i} step {step}: balls {error:.3g} px apart')
+                break
+        if game.state_stack[-1] is level:
+            level.exit_state()
+    print(f'{args.games} games, {compared} steps compared, largest ball distance {worst:.3g} px, '
+          f'{mismatches} games diverged')
+    return mismatches == 0
+
+
+def throughput(args):
+    # Steps per second for every number of games, after a quarter of the steps to get the games going
+    for count in args.counts:
+        env = VectorEnv(count, stage_set=args.stage_set, stages=tuple(args.stages), seed=args.seed,
+                        max_balls=args.max_balls)
+        observations = env.reset()
+        steps = args.bench_steps
+        for step in range(steps):
+            if step == steps // 4:
+                start = perf_counter()
+            observations, _, _ = env.step(track_balls(observations, step))
+        elapsed = perf_counter() - start
+        timed = steps - steps // 4
+        print(f'{count:6d} games: {timed / elapsed:9.0f} steps/s, {timed * count / elapsed:10.0f} game steps/s, '
+              f'{int(env.ball_count.sum())} balls')
+
+    # One sprite GameLevel with the bot for comparison, the way the batch runner plays
+    from pyknoid import Game
+    from engine.controllers import BallTrackingBot
+    from states.level import GameLevel
+    game = Game(headless=True, seed=args.seed)
+    game.controller = BallTrackingBot(game)
+    level = GameLevel(game, stage_set=PurePath(args.stage_set), stage=args.stages[0])
+    level.enter_state()
+    level.lives = 1000
+    for step in range(args.bench_steps):
+        if step == args.bench_steps // 4:
+            start = perf_counter()
+        game.step()
+    elapsed = perf_counter() - start
+    print(f'sprite GameLevel: {(args.bench_steps - args.bench_steps // 4) / elapsed:.0f} steps/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of the vectorized games, or --compare with GameLevel')
+    parser.add_argument('--compare', action='store_true', help='check the vectorized games against sprite levels')
+    parser.add_argument('--games', type=int, default=16, help='games to compare')
+    parser.add_argument('--steps', type=int, default=240*30, help='most steps to compare per game')
+    parser.add_argument('--counts', type=int, nargs='*', default=[1, 10, 100, 1000, 4000])
+    parser.add_argument('--bench-steps', type=int, default=1000, help='steps to run per number of games')
+    parser.add_argument('--stage-set', default='stages/test_set1.csv')
+    parser.add_argument('--stages', type=int, nargs='*', default=[1, 3, 4])
+    parser.add_argument('--max-balls', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(0 if compare(args) else 1)
+    throughput(args)
+
+
+if __name__ == '__main__':
+    main()